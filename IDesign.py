@@ -1,31 +1,87 @@
+import asyncio
 import autogen
+import contextlib
+import functools
+import io
 import json
+import multiprocessing
 import re
+from copy import deepcopy
+import networkx as nx
+import numpy as np
 from autogen.agentchat import GroupChatManager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from agents import is_termination_msg
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 from agents import create_agents, llama_json_config, llama_engineer_json_config
-from chats import GroupChat
+from corrector_agents import get_corrector_agents
+from refiner_agents import get_refiner_agents
+from chats import GroupChat, ChatWithEngineer, LayoutCorrectorGroupChat, ObjectDeletionGroupChat, LayoutRefinerGroupChat
 from utils import (
     get_room_priors, extract_list_from_json, preprocess_scene_graph,
-    build_graph, remove_unnecessary_edges, handle_under_prepositions,
-    get_conflicts, get_size_conflicts, get_object_from_scene_graph,
-    get_rotation, get_cluster_objects, clean_and_extract_edges,
-    get_cluster_size, get_possible_positions, is_point_bbox,
-    calculate_overlap, get_topological_ordering, place_object,
-    get_depth, get_visualization
+    remove_unnecessary_edges, handle_under_prepositions,
+    get_independent_conflicts, get_size_conflicts, get_object_from_scene_graph,
+    get_rotation, resolve_rotations, get_cluster_objects, clean_and_extract_edges,
+    get_cluster_sizes, invalidate_cluster_sizes, is_point_bbox, place_object, get_visualization,
+    build_collision_engine, get_conflicting_objects, propagate_constraints
 )
 from schemas import (
     initial_schema, interior_designer_schema,
-    interior_architect_schema, engineer_schema
+    interior_architect_schema, engineer_schema,
+    get_schema_errors, get_error_message
 )
+from scene_graph import SceneGraph
+from constraint_graph import ConstraintGraph
+from conflict_index import ConflictIndex
+from scoring import score_layout
+
+
+def run_backtrack_attempt(i_design, seed, verbose=False, quiet=True, **kwargs):
+    """
+    One backtracking attempt in a worker process. Returns the report and the placed scene graph
+    """
+    if verbose or not quiet:
+        report = i_design.backtrack(verbose=verbose, seed=seed, **kwargs)
+    else:
+        # The placement prints a lot, keep the workers quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = i_design.backtrack(seed=seed, **kwargs)
+    return report, i_design.scene_graph.to_json()
 
 class IDesign:
-    def __init__(self, no_of_objects, user_input, room_dimensions):
+    def __init__(self, no_of_objects, user_input, room_dimensions, seed=None, agent_pool=None):
         self.no_of_objects = no_of_objects
         self.user_input = user_input
         self.room_dimensions = room_dimensions
+        self.seed = seed
+        self.room_priors = get_room_priors(self.room_dimensions)
         self.scene_graph = None
+        self.constraint_graph = None
+        self.cluster_sizes = {}
+        self.agent_pool = agent_pool
+
+    def __getstate__(self):
+        # The agents stay in this process when the design is sent to a worker
+        state = self.__dict__.copy()
+        state["agent_pool"] = None
+        return state
+
+    def get_agents(self, factory, *args):
+        """Returns the agents of factory(*args), from the agent pool if there is one."""
+        if self.agent_pool is None:
+            return factory(*args)
+        return self.agent_pool.acquire(factory, *args)
+
+    def release_agents(self, factory, agents, *args):
+        """Gives agents from get_agents back to the agent pool."""
+        if self.agent_pool is not None:
+            self.agent_pool.release(factory, agents, *args)
+
+    def get_constraint_graph(self):
+        """Returns the constraint graph of the scene, building it on first use."""
+        if self.constraint_graph is None:
+            self.constraint_graph = ConstraintGraph(self.scene_graph["objects_in_room"])
+        return self.constraint_graph
 
     def extract_json(self, response):
         """Extracts the JSON portion from a response by cleaning unnecessary characters."""
@@ -59,15 +115,46 @@ class IDesign:
 
 
     def validate_json_data(self, json_data, schema):
-        """Validates JSON data against the provided schema."""
+        """Validates JSON data against the provided schema, reporting all the errors at once."""
+        errors = get_schema_errors(json_data, schema)
+        if len(errors) > 0:
+            raise ValidationError("JSON schema validation error: " + "; ".join(get_error_message(e) for e in errors))
+
+    def run_engineer_chat(self, obj):
+        """Runs an isolated engineer chat for one object and returns the objects the engineer created."""
+        agents = self.get_agents(create_agents, self.no_of_objects)
+        user_proxy, json_schema_debugger, _, _, engineer = agents
+        chat_with_engineer = ChatWithEngineer(
+            agents=[user_proxy, engineer, json_schema_debugger],
+            messages=[],
+            max_round=15
+        )
+        manager = GroupChatManager(groupchat=chat_with_engineer, is_termination_msg=is_termination_msg)
         try:
-            validate(instance=json_data, schema=schema)
-        except ValidationError as e:
-            raise ValidationError(f"JSON schema validation error: {e.message}")
+            user_proxy.initiate_chat(
+                manager,
+                message=json.dumps(obj)
+            )
+        finally:
+            self.release_agents(create_agents, agents, self.no_of_objects)
 
-    def create_initial_design(self):
-        """Initiates the design process by interacting with agents and processing their responses."""
-        user_proxy, json_schema_debugger, interior_designer, interior_architect, engineer = create_agents(self.no_of_objects)
+        # Extract and validate the response from the engineer
+        try:
+            raw_response_content = chat_with_engineer.messages[-2]["content"]
+            parsed_json_data = self.extract_json(raw_response_content)
+            self.validate_json_data(parsed_json_data, engineer_schema)
+        except (IndexError, ValueError, ValidationError) as e:
+            print(f"Error processing engineer response for {obj['new_object_id']}: {e}")
+            return []
+        return parsed_json_data.get("objects_in_room", [])
+
+    def create_initial_design(self, max_concurrency=4):
+        """
+        Initiates the design process by interacting with agents and processing their responses.
+        The engineer chats of the objects run concurrently, max_concurrency at a time.
+        """
+        agents = self.get_agents(create_agents, self.no_of_objects)
+        user_proxy, json_schema_debugger, interior_designer, interior_architect, engineer = agents
 
         # Check if any of the agents returned by create_agents() are None
         if None in (user_proxy, json_schema_debugger, interior_designer, interior_architect, engineer):
@@ -80,13 +167,6 @@ class IDesign:
             max_round=3
         )
 
-        # Group chat for engineer interactions
-        chat_with_engineer = GroupChat(
-            agents=[user_proxy, engineer, json_schema_debugger],
-            messages=[],
-            max_round=15
-        )
-
         # Ensure GroupChatManager has valid speaker selection
         manager = GroupChatManager(groupchat=groupchat, is_termination_msg=is_termination_msg)
         
@@ -105,6 +185,7 @@ class IDesign:
             json
             """,
         )
+        self.release_agents(create_agents, agents, self.no_of_objects)
 
         # Extract and clean the responses from designer and architect
         try:
@@ -131,8 +212,8 @@ class IDesign:
             print("HOBA")
             print(designer_response_clean)
             designer_response_json = json.loads(str(designer_response_clean))
-            architect_response_clean = str(architect_response_clean)
-            architect_response_json = json.loads(architect_response_clean)
+            # extract_json already parsed the architect's JSON
+            architect_response_json = architect_response_clean
 
             # Validate designer's response
             self.validate_json_data(designer_response_json, interior_designer_schema)
@@ -190,33 +271,16 @@ class IDesign:
         # Set the scene graph with the objects
         self.scene_graph = json_data
 
-        # Continue conversation with the engineer if needed
-        for obj in json_data["objects_in_room"]:
-            engineer.reset()
-            json_schema_debugger.reset()
-
-            manager = GroupChatManager(groupchat=chat_with_engineer, is_termination_msg=is_termination_msg)
-            user_proxy.initiate_chat(
-                manager,
-                message=json.dumps(obj)
-            )
-
-            # Extract and validate the response from the engineer
-            raw_response_content = chat_with_engineer.messages[-2]["content"]
-            extracted_json_content = self.extract_json(raw_response_content)
-
-            if extracted_json_content:
-                try:
-                    parsed_json_data = json.loads(extracted_json_content)
-                    self.validate_json_data(parsed_json_data, engineer_schema)
-
-                    if "objects_in_room" in parsed_json_data:
-                        json_data["objects_in_room"].extend(parsed_json_data["objects_in_room"])
-                except (json.JSONDecodeError, ValidationError) as e:
-                    print(f"Error processing engineer response: {e}")
+        # Continue conversation with the engineer, one isolated chat per object. The results are
+        # merged in the order of the objects, whatever order the chats finish in
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            engineer_objects = list(executor.map(self.run_engineer_chat, list(json_data["objects_in_room"])))
+        for objects in engineer_objects:
+            json_data["objects_in_room"].extend(objects)
 
         # Final scene graph with all objects placed in the room
         self.scene_graph = json_data
+        self.constraint_graph = None
 
 
     def match_objects_to_placements(self, objects, placements):
@@ -243,14 +307,42 @@ class IDesign:
         """Logs any placements that do not have matching objects."""
         print(f"Unmatched Placements: {unmatched_placements}")
 
-    def correct_design(self, verbose=False, auto_prune=True):
+    def run_corrector_chat(self, conflict):
+        """Runs an isolated spatial corrector chat for one conflict and returns the correction."""
+        agents = self.get_agents(get_corrector_agents)
+        user_proxy, spatial_corrector_agent, json_schema_debugger, _ = agents
+        groupchat = LayoutCorrectorGroupChat(
+            agents=[user_proxy, spatial_corrector_agent, json_schema_debugger],
+            messages=[],
+            max_round=15
+        )
+        manager = GroupChatManager(groupchat=groupchat, is_termination_msg=is_termination_msg)
+        try:
+            user_proxy.initiate_chat(
+                manager,
+                message=f"""
+                {conflict}
+                """,
+            )
+        finally:
+            self.release_agents(get_corrector_agents, agents)
+        correction = groupchat.messages[-2]
+        pattern = r'```json\s*([^`]+)\s*```'  # Match the JSON object
+        match = re.search(pattern, correction["content"], re.DOTALL).group(1)
+        return json.loads(match)
+
+    def correct_design(self, verbose=False, auto_prune=True, max_concurrency=4):
         # Correct Spatial Conflicts
         scene_graph = preprocess_scene_graph(self.scene_graph["objects_in_room"])
-        G = build_graph(scene_graph)
-        G = remove_unnecessary_edges(G)
+        self.constraint_graph = ConstraintGraph(scene_graph)
+        G = remove_unnecessary_edges(self.constraint_graph.G, scene_graph)
         G, scene_graph = handle_under_prepositions(G, scene_graph)
+        self.constraint_graph.refresh()
+        self.cluster_sizes = {}
 
-        conflicts = get_conflicts(G, scene_graph)
+        # After a correction, only the conflicts that depend on the corrected object are checked again
+        conflict_index = ConflictIndex(self.constraint_graph, scene_graph)
+        conflicts = conflict_index.get_conflicts()
 
         if verbose:
             print("-------------------CONFLICTS-------------------")
@@ -258,36 +350,26 @@ class IDesign:
                 print(conflict)
                 print("\n\n")
 
-        user_proxy, spatial_corrector_agent, json_schema_debugger, object_deletion_agent = get_corrector_agents()
+        agents = self.get_agents(get_corrector_agents)
+        user_proxy, _, _, object_deletion_agent = agents
 
-        while len(conflicts) > 0:
-            spatial_corrector_agent.reset()
-            json_schema_debugger.reset()
-            groupchat = LayoutCorrectorGroupChat(
-                agents=[user_proxy, spatial_corrector_agent, json_schema_debugger],
-                messages=[],
-                max_round=15
-            )
-            manager = GroupChatManager(groupchat=groupchat, is_termination_msg=is_termination_msg)
-            user_proxy.initiate_chat(
-                manager,
-                message=f"""
-                {conflicts[0]}
-                """,
-            )
-            correction = groupchat.messages[-2]
-            pattern = r'```json\s*([^`]+)\s*```'  # Match the JSON object
-            match = re.search(pattern, correction["content"], re.DOTALL).group(1)
-            correction_json = json.loads(match)
-            corr_obj = get_object_from_scene_graph(correction_json["corrected_object"]["new_object_id"], scene_graph)
-            corr_obj["is_on_the_floor"] = correction_json["corrected_object"]["is_on_the_floor"]
-            corr_obj["facing"] = correction_json["corrected_object"]["facing"]
-            corr_obj["placement"] = correction_json["corrected_object"]["placement"]
-            G = build_graph(scene_graph)
-            conflicts = get_conflicts(G, scene_graph)
+        # Conflicts about disjoint sets of objects are fixed at the same time, the conflicts are checked again after every round
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            while len(conflicts) > 0:
+                independent_conflicts = get_independent_conflicts(conflicts, G)
+                if verbose:
+                    print(f"Fixing {len(independent_conflicts)} of {len(conflicts)} conflicts")
+                for correction_json in executor.map(self.run_corrector_chat, independent_conflicts):
+                    corr_obj = get_object_from_scene_graph(correction_json["corrected_object"]["new_object_id"], scene_graph)
+                    corr_obj["is_on_the_floor"] = correction_json["corrected_object"]["is_on_the_floor"]
+                    corr_obj["facing"] = correction_json["corrected_object"]["facing"]
+                    corr_obj["placement"] = correction_json["corrected_object"]["placement"]
+                    conflict_index.update_object(corr_obj)
+                conflicts = conflict_index.get_conflicts()
 
         if auto_prune:
-            size_conflicts = get_size_conflicts(G, scene_graph, self.user_input, self.room_priors, verbose)
+            # The cluster sizes are kept for the clusters that a deletion doesn't change, and for create_object_clusters
+            size_conflicts = get_size_conflicts(G, scene_graph, self.user_input, self.room_priors, verbose, self.cluster_sizes)
 
             if verbose:
                 print("-------------------SIZE CONFLICTS-------------------")
@@ -315,14 +397,35 @@ class IDesign:
                 descendants = nx.descendants(G, object_to_delete)
                 objs_to_delete = descendants.union({object_to_delete})
                 print("Objs to Delete: ", objs_to_delete)
+                invalidate_cluster_sizes(self.cluster_sizes, G, objs_to_delete)
                 scene_graph = [x for x in scene_graph if x["new_object_id"] not in objs_to_delete]
                 for obj in objs_to_delete:
-                    G.remove_node(obj)
+                    self.constraint_graph.remove_object(obj)
 
-                size_conflicts = get_size_conflicts(G, scene_graph, self.user_input, self.room_priors, verbose)
+                size_conflicts = get_size_conflicts(G, scene_graph, self.user_input, self.room_priors, verbose, self.cluster_sizes)
+        self.release_agents(get_corrector_agents, agents)
         self.scene_graph["objects_in_room"] = scene_graph
 
-    def refine_design(self, verbose=False):
+    def run_refiner_chat(self, message):
+        """Runs an isolated layout refiner chat for one cluster and returns the refiner's response."""
+        agents = self.get_agents(get_refiner_agents)
+        user_proxy, layout_refiner, json_schema_debugger = agents
+        groupchat = LayoutRefinerGroupChat(
+            agents=[user_proxy, layout_refiner, json_schema_debugger],
+            messages=[],
+            max_round=15
+        )
+        manager = GroupChatManager(groupchat=groupchat, is_termination_msg=is_termination_msg)
+        try:
+            user_proxy.initiate_chat(
+                manager,
+                message=message,
+            )
+        finally:
+            self.release_agents(get_refiner_agents, agents)
+        return groupchat.messages[-2]["content"]
+
+    def refine_design(self, verbose=False, max_concurrency=4):
         # Cluster objects for refinement
         cluster_dict = get_cluster_objects(self.scene_graph["objects_in_room"])
 
@@ -348,50 +451,48 @@ class IDesign:
                 print(f"The children objects are '{prep}' the parent object")
                 print("\n")
 
+        # The rotations are resolved once and only resolved again for the objects that get new parents
+        scene_graph = SceneGraph(self.scene_graph["objects_in_room"])
 
-        for parent_id, prep, obj_names in inputs:
-            objs = [get_object_from_scene_graph(obj, self.scene_graph["objects_in_room"]) for obj in obj_names]
-            objs_rot = [get_rotation(obj, self.scene_graph["objects_in_room"]) for obj in objs]
-
-            parent_obj = get_object_from_scene_graph(parent_id, self.scene_graph["objects_in_room"])
+        def get_parent_rotation(parent_id):
+            parent_obj = get_object_from_scene_graph(parent_id, scene_graph)
             if parent_obj is None:
                 parent_obj = [prior for prior in self.room_priors if prior.get("new_object_id") == parent_id][0]
-            parent_obj_rot = get_rotation(parent_obj, self.scene_graph["objects_in_room"])
+            return get_rotation(parent_obj, scene_graph)
 
-            rot_diffs = [obj_rot - parent_obj_rot for obj_rot in objs_rot]
-            direction_check = lambda diff, prep: (diff % 180 == 0 and prep in ["left of", "right of"]) or (diff % 180 != 0 and prep in ["in front", "behind"]) or (diff % 180 != 0 and prep == "on")
-            possibilities_str = "Constraints:\n" + '\n'.join(["\t" + f"Place objects {'`behind` or `in front`' if direction_check(diff, prep) else '`left of` or `right of`'} of {name}!" for name, diff in zip(obj_names, rot_diffs)])
+        direction_check = lambda diff, prep: (diff % 180 == 0 and prep in ["left of", "right of"]) or (diff % 180 != 0 and prep in ["in front", "behind"]) or (diff % 180 != 0 and prep == "on")
 
-            user_proxy, layout_refiner, json_schema_debugger = get_refiner_agents()
+        messages = []
+        for parent_id, prep, obj_names in inputs:
+            objs = [get_object_from_scene_graph(obj, scene_graph) for obj in obj_names]
+            objs_rot = [get_rotation(obj, scene_graph) for obj in objs]
+            parent_obj_rot = get_parent_rotation(parent_id)
 
-            layout_refiner.reset()
-            json_schema_debugger.reset()
-            groupchat = LayoutRefinerGroupChat(
-                agents=[user_proxy, layout_refiner, json_schema_debugger],
-                messages=[],
-                max_round=15
-            )
-            manager = GroupChatManager(groupchat=groupchat, is_termination_msg=is_termination_msg)
-            user_proxy.initiate_chat(
-                manager,
-                message=f"""
+            rot_diffs = [obj_rot - parent_obj_rot for obj_rot in objs_rot]
+            possibilities_str = "Constraints:\n" + '\n'.join(["\t" + f"Place objects {'`behind` or `in front`' if direction_check(diff, prep) else '`left of` or `right of`'} of {name}!" for name, diff in zip(obj_names, rot_diffs)])
+            messages.append(f"""
                 Parent Object : {parent_id}
                 Children Objects : {obj_names}
 
                 {possibilities_str}
 
                 The children objects are '{prep}' the parent object
-                """,
-            )
+                """)
 
-            new_relationships = json.loads(groupchat.messages[-2]["content"])
+        # The clusters are refined concurrently and their relationships are added in the order of the clusters
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            responses = list(executor.map(self.run_refiner_chat, messages))
+
+        for (parent_id, prep, obj_names), response in zip(inputs, responses):
+            parent_obj_rot = get_parent_rotation(parent_id)
+            new_relationships = json.loads(response)
             if "items" in new_relationships["children_objects"]:
                 new_relationships = {"children_objects" : new_relationships["children_objects"]["items"]}
             # Check whether the relationships are valid
             invalid_name_ids = []
             for child in new_relationships["children_objects"]:
                 for other_child in child["placement"]["children_objects"]:
-                    other_child_rot = get_rotation(get_object_from_scene_graph(other_child["name_id"], self.scene_graph["objects_in_room"]), self.scene_graph["objects_in_room"])
+                    other_child_rot = get_rotation(get_object_from_scene_graph(other_child["name_id"], scene_graph), scene_graph)
                     if direction_check(other_child_rot - parent_obj_rot, prep) and other_child["preposition"] not in ["in front", "behind"]:
                         invalid_name_ids.append(child["name_id"])
                     elif not direction_check(other_child_rot - parent_obj_rot, prep) and other_child["preposition"] not in ["left of", "right of"]:
@@ -420,126 +521,282 @@ class IDesign:
                     if (name_id, r["name_id"]) in edges:
                         to_flip = edges_to_flip[(name_id, r["name_id"])]
                         if to_flip:
-                            corr_obj = get_object_from_scene_graph(r["name_id"], self.scene_graph["objects_in_room"])
+                            corr_obj = get_object_from_scene_graph(r["name_id"], scene_graph)
                             corr_prep = prep_correspondences[r["preposition"]]
                             corr_obj["placement"]["objects_in_room"].append({"object_id": name_id, "preposition": corr_prep, "is_adjacent": r["is_adjacent"]})
                         else:
-                            corr_obj = get_object_from_scene_graph(name_id, self.scene_graph["objects_in_room"])
+                            corr_obj = get_object_from_scene_graph(name_id, scene_graph)
                             corr_obj["placement"]["objects_in_room"].append({"object_id": r["name_id"], "preposition": r["preposition"], "is_adjacent": r["is_adjacent"]})
+                        scene_graph.update(corr_obj["new_object_id"])
+                        self.get_constraint_graph().update_object(corr_obj)
+                        invalidate_cluster_sizes(self.cluster_sizes, self.get_constraint_graph().G, [corr_obj["new_object_id"]])
 
     def create_object_clusters(self, verbose=False):
+        scene_graph = SceneGraph(self.scene_graph["objects_in_room"])
         # Assign the rotations
-        for obj in self.scene_graph["objects_in_room"]:
-            rot = get_rotation(obj, self.scene_graph["objects_in_room"])
+        unresolved = resolve_rotations(scene_graph)
+        if len(unresolved) > 0:
+            print("The facing of these objects can't be resolved, they are in a cycle or placed relative to a missing object: ", unresolved)
+        for obj in scene_graph:
+            rot = get_rotation(obj, scene_graph)
             obj["rotation"] = {"z_angle": rot}
         
         ROOM_LAYOUT_ELEMENTS = ["south_wall", "north_wall", "west_wall", "east_wall", "ceiling", "middle of the room"]
 
-        G = build_graph(self.scene_graph["objects_in_room"])
+        G = self.get_constraint_graph().G
         nodes = G.nodes()
+        cluster_sizes = get_cluster_sizes(G, scene_graph, self.cluster_sizes)
 
         # Create clusters
         for node in nodes:
             if node not in ROOM_LAYOUT_ELEMENTS:
-                cluster_size, children_objs = get_cluster_size(node, G, self.scene_graph["objects_in_room"])
+                cluster_size, children_objs = cluster_sizes[node]
                 if verbose:
                     print("Node: ", node)
                     print("Cluster size: ", cluster_size)
                     print("Children: ", children_objs)
                     print("\n")
-                node_obj = get_object_from_scene_graph(node, self.scene_graph["objects_in_room"])
+                node_obj = get_object_from_scene_graph(node, scene_graph)
                 cluster_size = {"x_neg": cluster_size["left of"], "x_pos": cluster_size["right of"], "y_neg": cluster_size["behind"], "y_pos": cluster_size["in front"]}
                 node_obj["cluster"] = {"constraint_area": cluster_size}
 
-    def backtrack(self, verbose=False):
-        self.scene_graph = self.scene_graph["objects_in_room"] + self.room_priors
+    def backtrack(self, verbose=False, max_iterations=1000, max_retries=20, seed=None, sampling="uniform", n_layouts=1, max_attempts=10000, stop=None):
+        """
+        Assigns positions to the objects with a backjumping search. When an object can't be
+        placed, the search jumps back to the most recently placed object the failure is
+        blamed on and only clears that object, the failed object and their descendants. An object
+        with nothing to blame is sampled again. After max_retries failures the object is abandoned
+        and its descendants are blocked. The search stops after max_iterations calls of
+        place_object or max_attempts candidate positions tried in total, the positions tried for
+        the children placed by their parents included, or as soon as the stop event is set.
+        The positions are sampled with an RNG seeded with seed (self.seed if not given), so the
+        same seed gives the same layout. sampling is "uniform", "halton" or "sobol".
+        With n_layouts > 1, that many layouts are generated and the one placing the most objects
+        with the best quality score is kept.
+        Returns a report of the outcome, with the quality metrics of the layout.
+        """
+        seed = seed if seed is not None else self.seed
+        if n_layouts > 1:
+            objects = deepcopy(self.scene_graph["objects_in_room"])
+            seeds = [int(x) for x in np.random.SeedSequence(seed).generate_state(n_layouts)]
+            best = None
+            for i, layout_seed in enumerate(seeds):
+                self.scene_graph = {"objects_in_room" : deepcopy(objects)}
+                report = self.backtrack(max_iterations=max_iterations, max_retries=max_retries, seed=layout_seed, sampling=sampling, max_attempts=max_attempts, stop=stop)
+                if verbose:
+                    print(f"Layout {i}: ", report)
+                key = (-len(report["unplaced"]), report["quality"]["score"])
+                if best is None or key > best[0]:
+                    best = (key, dict(report, layout=i, seed=layout_seed), self.scene_graph)
+            _, report, self.scene_graph = best
+            if verbose:
+                print("Kept layout: ", report)
+                get_visualization(self.scene_graph, self.room_priors)
+            return report
+
+        rng = np.random.default_rng(seed)
+        constraint_graph = self.get_constraint_graph()
+        self.scene_graph = SceneGraph(self.scene_graph["objects_in_room"] + self.room_priors)
         prior_ids = ["south_wall", "north_wall", "east_wall", "west_wall", "ceiling", "middle of the room"]
         
         point_bbox = dict.fromkeys([item["new_object_id"] for item in self.scene_graph], False)
         
-        # Place the objects that have an absolute position
+        # Tighten the possible positions of every object with its parents and children first,
+        # the objects whose box collapsed to a point have an absolute position
+        domains = propagate_constraints(self.scene_graph, self.room_dimensions, constraint_graph.get_topological_ordering(), verbose=verbose)
+        infeasible = [key for key, value in domains.items() if value is None]
         for item in self.scene_graph:
             if item["new_object_id"] in prior_ids:
                 continue
-            possible_pos = get_possible_positions(item["new_object_id"], self.scene_graph, self.room_dimensions)
-            # Determine the overlap based on the possible positions
-            overlap = None
-            if len(possible_pos) == 1:
-                overlap = possible_pos[0]
-            elif len(possible_pos) > 1:
-                overlap = possible_pos[0]
-                for pos in possible_pos[1:]:
-                    overlap = calculate_overlap(overlap, pos)
-            # If the overlap is a point bbox, assign the position
-            if overlap is not None and is_point_bbox(overlap) and len(possible_pos) > 0:
-                item["position"] = {"x": overlap[0], "y": overlap[2], "z": overlap[4]}
+            domain = domains.get(item["new_object_id"])
+            if domain is not None and is_point_bbox(domain):
+                item["position"] = {"x": domain[0], "y": domain[2], "z": domain[4]}
                 point_bbox[item["new_object_id"]] = True
+        if len(infeasible) > 0:
+            print("The constraints of these objects can't be satisfied: ", infeasible)
         
         scene_graph_wo_layout = [item for item in self.scene_graph if item["new_object_id"] not in prior_ids]
         object_ids = [item["new_object_id"] for item in scene_graph_wo_layout]
         # Get depths
-        depth_scene_graph = get_depth(scene_graph_wo_layout)
+        depth_scene_graph = constraint_graph.get_depth()
         max_depth = max(depth_scene_graph.values())
         
         if verbose:
             print("Max depth: ", max_depth)
             print("Depth scene graph: ", depth_scene_graph)
             print("Point BBox: ", [key for key, value in point_bbox.items() if value])
+            print("Propagated boxes: ", domains)
             get_visualization(self.scene_graph, self.room_priors)
             for obj in scene_graph_wo_layout:
                 if "position" in obj.keys():
                     print(obj["new_object_id"], obj["position"])
         
-        topological_order = get_topological_ordering(scene_graph_wo_layout)
-        topological_order = [item for item in topological_order if item not in prior_ids]
+        full_topological_order = constraint_graph.get_topological_ordering()
+        topological_order = [item for item in full_topological_order if item not in prior_ids]
         if verbose:
             print("Topological order: ", topological_order)
         
-        d = 1
-        while d <= max_depth:   
+        collision_engine = build_collision_engine(self.scene_graph, self.room_dimensions)
+        # Place the objects depth by depth, in topological order within a depth
+        placement_order = sorted(topological_order, key=lambda x : depth_scene_graph[x])
+        ranks = {node : i for i, node in enumerate(placement_order)}
+        failures = dict.fromkeys(placement_order, 0)
+        # The infeasible objects are left out from the start
+        abandoned = [node for node in placement_order if node in infeasible]
+        # The descendants of an abandoned object can't be placed without it
+        blocked = []
+        budget = {"attempts" : max_attempts, "stop" : stop}
+        iterations = 0
+        i = 0
+        while i < len(placement_order) and iterations < max_iterations and budget["attempts"] > 0:
+            node = placement_order[i]
+            if point_bbox.get(node, False) or node in abandoned or node in blocked or node not in self.scene_graph:
+                i += 1
+                continue
+
+            iterations += 1
+            obj = self.scene_graph.get(node)
+            errors = place_object(obj, self.scene_graph, self.room_dimensions, errors={}, verbose=verbose, topological_order=full_topological_order, collision_engine=collision_engine, domains=domains, rng=rng, sampling=sampling, budget=budget)
             if verbose:
-                print("Depth: ", d)
-            error_flag = False
-            
-            # Get nodes at the current depth
-            nodes = [node for node in topological_order if depth_scene_graph[node] == d]
+                print(f"Errors for {obj['new_object_id']}:", errors)
+            if not errors:
+                i += 1
+                continue
+            if budget["attempts"] <= 0:
+                if verbose:
+                    print("Out of attempts at: ", node)
+                break
+
+            failures[node] += 1
+            culprits = [x for x in get_conflicting_objects(errors, self.scene_graph, self.room_dimensions, collision_engine) if x in ranks and x != node and not point_bbox[x]]
+            if failures[node] > max_retries:
+                # Moving the other objects didn't help, leave this one and its descendants out
+                if verbose:
+                    print("Giving up on: ", node)
+                abandoned.append(node)
+                for x in nx.descendants(constraint_graph.G, node):
+                    if x in ranks and not point_bbox[x] and x not in abandoned and x not in blocked:
+                        blocked.append(x)
+                i += 1
+                continue
+            if len(culprits) == 0:
+                # The failure is in the object's own subtree, place_object cleared it while
+                # recursing, or nothing else can be moved: sample the object again
+                if verbose:
+                    print("Retrying: ", node)
+                for del_id in nx.descendants(constraint_graph.G, node):
+                    del_item = self.scene_graph.get(del_id)
+                    if del_item is not None and "position" in del_item.keys() and not point_bbox.get(del_id, False):
+                        del del_item["position"]
+                        collision_engine.remove(del_id)
+                continue
+
+            # Jump back to the most recently placed culprits and clear their dependent subtrees,
+            # the more often the object failed the further back the search jumps
+            culprits = sorted(culprits, key=lambda x : ranks[x], reverse=True)[:failures[node]]
+            to_clear = {node}.union(nx.descendants(constraint_graph.G, node))
+            for culprit in culprits:
+                to_clear.add(culprit)
+                to_clear.update(nx.descendants(constraint_graph.G, culprit))
             if verbose:
-                print(f"Nodes at depth {d}:", nodes)
-            
-            errors = {}
-            for node in nodes:
-                if point_bbox[node]:
-                    continue
-                
-                # Find the object corresponding to the current node
-                obj = next(item for item in scene_graph_wo_layout if item["new_object_id"] == node)
-                errors = place_object(obj, self.scene_graph, self.room_dimensions, errors={}, verbose=verbose)
+                print(f"Jumping back to {culprits} for {node}, clearing: ", to_clear)
+            for del_id in to_clear:
+                del_item = self.scene_graph.get(del_id)
+                if del_item is not None and "position" in del_item.keys() and not point_bbox[del_id]:
+                    del del_item["position"]
+                    collision_engine.remove(del_id)
+            i = min(ranks[x] for x in to_clear if x in ranks)
+
+        unplaced = [item["new_object_id"] for item in scene_graph_wo_layout if "position" not in item.keys()]
+        report = {
+            "success": len(unplaced) == 0,
+            "iterations": iterations,
+            "attempts": max_attempts - budget["attempts"],
+            "unplaced": unplaced,
+            "abandoned": abandoned,
+            "blocked": [node for node in placement_order if node in blocked],
+            "infeasible": [node for node in placement_order if node in infeasible],
+            "quality": score_layout(self.scene_graph, self.room_dimensions)
+        }
+        if verbose:
+            print("Backtracking report: ", report)
+            get_visualization(self.scene_graph, self.room_priors)
+        return report
+
+    def backtrack_parallel(self, n_attempts=4, max_workers=None, first_success=True, verbose=False, seed=None, **kwargs):
+        """
+        Runs n_attempts independently seeded backtracking attempts on a process pool.
+        With first_success, the first attempt that places every object is kept, the attempts
+        that haven't started are cancelled and the running ones are stopped. Otherwise, or if no attempt succeeds, the attempt that
+        placed the most objects with the best quality score is kept, the lowest attempt number
+        winning ties.
+        The attempt seeds are derived from seed (self.seed if not given).
+        Returns the report of the kept attempt with its attempt number and seed
+        """
+        seed = seed if seed is not None else self.seed
+        seeds = [int(x) for x in np.random.SeedSequence(seed).generate_state(n_attempts)]
+        results = {}
+        # The running attempts check the event and stop once another one succeeded
+        manager = multiprocessing.Manager() if first_success else None
+        stop = manager.Event() if first_success else None
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {executor.submit(run_backtrack_attempt, self, attempt_seed, verbose, stop=stop, **kwargs) : i for i, attempt_seed in enumerate(seeds)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
                 if verbose:
-                    print(f"Errors for {obj['new_object_id']}:", errors)
-
-                if errors:
-                    if d > 1:
-                        d -= 1
-                        if verbose:
-                            print("Reducing depth to: ", d)
-                    
-                    error_flag = True
-                    # Delete positions for objects at or beyond the current depth
-                    for del_item in scene_graph_wo_layout:
-                        if depth_scene_graph[del_item["new_object_id"]] >= d:
-                            if "position" in del_item.keys() and not point_bbox[del_item["new_object_id"]]:
-                                if verbose:
-                                    print("Deleting position for: ", del_item["new_object_id"])
-                                del del_item["position"]
-                    errors = {}
+                    print(f"Attempt {futures[future]} finished: ", results[futures[future]][0])
+                if first_success and results[futures[future]][0]["success"]:
                     break
-                            
-            if not error_flag:
-                d += 1
+        finally:
+            if stop is not None:
+                stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            if manager is not None:
+                manager.shutdown()
+
+        successful = [i for i in results.keys() if results[i][0]["success"]]
+        if first_success and len(successful) > 0:
+            best = successful[0]
+        else:
+            best = max(sorted(results.keys()), key=lambda i : (-len(results[i][0]["unplaced"]), results[i][0]["quality"]["score"]))
+        report, scene_graph = results[best]
+        self.scene_graph = SceneGraph(scene_graph)
+        report = dict(report, attempt=best, seed=seeds[best])
         if verbose:
+            print("Kept attempt: ", report)
             get_visualization(self.scene_graph, self.room_priors)
-    
+        return report
+
     def to_json(self, filename="scene_graph.json"):
         # Save the scene graph to a JSON file
+        scene_graph = self.scene_graph.to_json() if isinstance(self.scene_graph, SceneGraph) else self.scene_graph
         with open(filename, "w") as file:
-            json.dump(self.scene_graph, file, indent=4)
+            json.dump(scene_graph, file, indent=4)
+
+    async def arun(self, filename="scene_graph.json", verbose=False, executor=None, max_concurrency=4, **backtrack_kwargs):
+        """
+        Runs the whole pipeline, from create_initial_design to to_json, without blocking the event loop,
+        so that many rooms can be designed concurrently in one process. The stages waiting on the LLM run
+        in the default thread pool, backtrack runs in executor, which can be a ProcessPoolExecutor.
+        Gives the same scene graph as calling the synchronous methods in order.
+        Returns the backtracking report
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self.create_initial_design, max_concurrency=max_concurrency))
+        await loop.run_in_executor(None, functools.partial(self.correct_design, verbose=verbose, max_concurrency=max_concurrency))
+        await loop.run_in_executor(None, functools.partial(self.refine_design, verbose=verbose, max_concurrency=max_concurrency))
+        await loop.run_in_executor(None, functools.partial(self.create_object_clusters, verbose=verbose))
+        report = await self.abacktrack(executor=executor, verbose=verbose, **backtrack_kwargs)
+        await loop.run_in_executor(None, self.to_json, filename)
+        return report
+
+    async def abacktrack(self, executor=None, verbose=False, **kwargs):
+        """
+        backtrack in executor (the default thread pool if None). The placed scene graph is copied back,
+        so that a process pool works as well
+        """
+        loop = asyncio.get_running_loop()
+        report, scene_graph = await loop.run_in_executor(executor, functools.partial(run_backtrack_attempt, self, kwargs.pop("seed", None), verbose, quiet=False, **kwargs))
+        self.scene_graph = SceneGraph(scene_graph)
+        return report
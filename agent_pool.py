@@ -0,0 +1,36 @@
+import threading
+
+
+class AgentPool:
+    """
+    Keeps the agents made by the agent factories (create_agents, get_corrector_agents,
+    get_refiner_agents) so that designing many rooms in one process reuses the agents and
+    their HTTP clients instead of creating new ones for every chat. Agents are reset when
+    they are given back, and every acquire gets a set that nobody else is using
+    """
+    def __init__(self):
+        self._free = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, factory, *args):
+        """
+        Returns the tuple of agents of factory(*args), reusing a released one if there is any
+        """
+        key = (factory, args)
+        with self._lock:
+            if len(self._free.get(key, [])) > 0:
+                self.reused += 1
+                return self._free[key].pop()
+            self.created += 1
+        return factory(*args)
+
+    def release(self, factory, agents, *args):
+        """
+        Gives the agents of factory(*args) back to the pool
+        """
+        for agent in agents:
+            agent.reset()
+        with self._lock:
+            self._free.setdefault((factory, args), []).append(agents)
@@ -1,13 +1,17 @@
 import autogen
 from autogen import AssistantAgent, UserProxyAgent
 import json
-from jsonschema import validate
 from copy import deepcopy
+from llm_cache import attach_response_cache
+from local_llm import attach_local_backend
+from json_repair import attach_json_repair, repair_objects_in_room
 from schemas import (
     initial_schema,
     interior_designer_schema,
     interior_architect_schema,
-    engineer_schema
+    engineer_schema,
+    get_schema_errors,
+    get_error_message
 )
 # Load configuration from the environment variable or JSON file (OAI_CONFIG_LIST)
 config_list = autogen.config_list_from_json("OAI_CONFIG_LIST.json")
@@ -18,7 +22,7 @@ config_list_llama_8b = [config for config in config_list if config["model"] == "
 
 # Model configuration settings for Llama Vision (11B)
 llama_vision_config = {
-    "cache_seed": 42,
+    "cache_seed": None,  # Responses are cached by llm_cache
     "temperature": 0.7,
     "top_p": 1.0,
     "config_list": config_list_llama_vision,
@@ -27,7 +31,7 @@ llama_vision_config = {
 
 # Model configuration settings for Llama 8B
 llama_8b_config = {
-    "cache_seed": 42,
+    "cache_seed": None,  # Responses are cached by llm_cache
     "temperature": 0.7,
     "top_p": 1.0,
     "config_list": config_list_llama_8b,
@@ -70,23 +74,22 @@ class JSONSchemaAgent(UserProxyAgent):
         except KeyError:
             return "Use 'new_object_id' instead of 'object_id'!"
 
-        is_success = False
-        try:
-            validate(instance=json_obj_new, schema=initial_schema)
-            is_success = True
-        except Exception as e:
-            feedback = str(e)
+        # Every error goes back to the LLM in one reply
+        feedback = []
+        for e in get_schema_errors(json_obj_new, initial_schema):
+            error_feedback = get_error_message(e)
             if e.validator == "enum":
                 if e.instance in json_obj_new_ids:
-                    feedback += f" Put the {e.instance} object under 'objects_in_room' instead of 'room_layout_elements' and delete the {e.instance} object under 'room_layout_elements'."
-                elif str(preps_objs) in feedback:
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
-                elif str(preps_layout) in feedback:
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
-        
-        if is_success:
+                    error_feedback += f" Put the {e.instance} object under 'objects_in_room' instead of 'room_layout_elements' and delete the {e.instance} object under 'room_layout_elements'."
+                elif str(preps_objs) in error_feedback:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
+                elif str(preps_layout) in error_feedback:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
+            feedback.append(error_feedback)
+
+        if len(feedback) == 0:
             return "SUCCESS"
-        return feedback
+        return "\n".join(feedback)
 
 # Function to create and return the agents
 def create_agents(no_of_objects: int):
@@ -156,5 +159,12 @@ def create_agents(no_of_objects: int):
         """
     )
 
+    # Answer repeated requests from the response cache, or from the local backend when there is one
+    for agent in (interior_designer, interior_architect, engineer):
+        attach_response_cache(agent)
+        attach_local_backend(agent)
+    # Fix the mechanical schema errors locally instead of in another round with the debugger
+    attach_json_repair(engineer, repair_objects_in_room)
+
     # Return all agents
     return user_proxy, json_schema_debugger, interior_designer, interior_architect, engineer
@@ -0,0 +1,75 @@
+import argparse
+import json
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from IDesign import IDesign, run_backtrack_attempt
+from agent_pool import AgentPool
+
+
+def read_jobs(filename):
+    """
+    Reads the {"user_input", "room_dimensions", "no_of_objects"} jobs of a JSONL file, skipping empty lines
+    """
+    with open(filename, "r") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def design_rooms(jobs, agent_pool=None, executor=None, seed=None, verbose=False, **backtrack_kwargs):
+    """
+    Designs a room for every job and yields one record per job, in the order of the jobs, with the
+    scene graph and the backtracking report, or the error if the job failed.
+    The agents are shared by all the jobs through agent_pool. While the LLM stages of a job run,
+    the backtracking of the previous job runs in executor (a single worker process if None)
+    """
+    agent_pool = agent_pool if agent_pool is not None else AgentPool()
+    own_executor = executor is None
+    executor = executor if executor is not None else ProcessPoolExecutor(max_workers=1)
+
+    def get_record(job_id, job, result):
+        record = {"job_id" : job_id, **job}
+        try:
+            record["report"], record["scene_graph"] = result.result()
+        except Exception as e:
+            record["error"] = repr(e)
+        return record
+
+    pending = None
+    try:
+        for job_id, job in enumerate(jobs):
+            i_design = IDesign(job["no_of_objects"], job["user_input"], job["room_dimensions"], seed=job.get("seed", seed), agent_pool=agent_pool)
+            try:
+                i_design.create_initial_design()
+                i_design.correct_design(verbose=verbose)
+                i_design.refine_design(verbose=verbose)
+                i_design.create_object_clusters(verbose=verbose)
+                result = executor.submit(run_backtrack_attempt, i_design, None, verbose, **backtrack_kwargs)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                result = Future()
+                result.set_exception(e)
+
+            # The previous room was placed while this one talked to the LLMs
+            if pending is not None:
+                yield get_record(*pending)
+            pending = (job_id, job, result)
+        if pending is not None:
+            yield get_record(*pending)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Design a room for every job of a JSONL file of {user_input, room_dimensions, no_of_objects} jobs")
+    parser.add_argument("jobs", help="JSONL file with one job per line")
+    parser.add_argument("-o", "--output", default="scene_graphs.jsonl", help="JSONL file the scene graphs are streamed to, one line per job")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the placement, for jobs without their own seed")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    agent_pool = AgentPool()
+    with open(args.output, "w") as file:
+        for record in design_rooms(read_jobs(args.jobs), agent_pool=agent_pool, seed=args.seed, verbose=args.verbose):
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+    print(f"Agents created: {agent_pool.created}, reused: {agent_pool.reused}")
@@ -0,0 +1,198 @@
+import numpy as np
+
+# Boxes that only touch each other within this tolerance don't collide
+TOUCH_TOLERANCE = 1e-3
+
+def boxes_overlap(boxes_1, boxes_2):
+    """
+    Pairwise collision test between two sets of (x_min, x_max, y_min, y_max, z_min, z_max) boxes.
+    Returns a (len(boxes_1), len(boxes_2)) boolean array
+    """
+    boxes_1 = np.asarray(boxes_1, dtype=float).reshape(-1, 6)
+    boxes_2 = np.asarray(boxes_2, dtype=float).reshape(-1, 6)
+    min_1, max_1 = boxes_1[:, None, 0::2], boxes_1[:, None, 1::2]
+    min_2, max_2 = boxes_2[None, :, 0::2], boxes_2[None, :, 1::2]
+    overlap = (min_1 < max_2) & (max_1 > min_2) & (np.abs(min_1 - max_2) > TOUCH_TOLERANCE) & (np.abs(max_1 - min_2) > TOUCH_TOLERANCE)
+    return overlap.all(axis=2)
+
+
+class CollisionEngine:
+    """
+    Keeps the axis-aligned boxes of the placed objects in one contiguous (N, 6) array
+    and tests candidate boxes against all of them at once.
+    If the room dimensions are given, a uniform grid over the floor is used as a broad
+    phase so that only the boxes close to the candidates are tested
+    """
+    def __init__(self, capacity=64, room_dimensions=None, cell_size=0.5):
+        self.boxes = np.empty((capacity, 6), dtype=float)
+        self.ids = []
+        self._rows = {}
+        self.grid = None
+        if room_dimensions is not None:
+            self.cell_size = cell_size
+            self.grid_shape = (max(1, int(np.ceil(room_dimensions[0] / cell_size))), max(1, int(np.ceil(room_dimensions[1] / cell_size))))
+            # (i, j) cell -> ids of the boxes touching the cell
+            self.grid = {}
+            self._cells = {}
+
+    def _get_cells(self, box):
+        # Boxes sticking out of the room are clamped to the border cells
+        i_min, i_max = [min(max(int(np.floor(x / self.cell_size)), 0), self.grid_shape[0] - 1) for x in (box[0], box[1])]
+        j_min, j_max = [min(max(int(np.floor(y / self.cell_size)), 0), self.grid_shape[1] - 1) for y in (box[2], box[3])]
+        return [(i, j) for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1)]
+
+    def _add_to_grid(self, obj_id, box):
+        cells = self._get_cells(box)
+        for cell in cells:
+            self.grid.setdefault(cell, set()).add(obj_id)
+        self._cells[obj_id] = cells
+
+    def _remove_from_grid(self, obj_id):
+        for cell in self._cells.pop(obj_id, []):
+            self.grid[cell].discard(obj_id)
+
+    def _get_nearby_rows(self, boxes, exclude=()):
+        # Broad phase, rows of the boxes sharing a grid cell with the region spanned by the boxes
+        if self.grid is None:
+            return self._get_rows(exclude)
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        if len(boxes) == 0:
+            return []
+        region = (boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].min(), boxes[:, 3].max())
+        nearby = set()
+        for cell in self._get_cells(region):
+            nearby.update(self.grid.get(cell, ()))
+        nearby.difference_update(exclude)
+        return sorted(self._rows[x] for x in nearby)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, obj_id):
+        return obj_id in self._rows
+
+    def set(self, obj_id, box):
+        """
+        Add the box of an object or move it if the object is already stored
+        """
+        if self.grid is not None:
+            self._remove_from_grid(obj_id)
+            self._add_to_grid(obj_id, box)
+        if obj_id in self._rows:
+            self.boxes[self._rows[obj_id]] = box
+            return
+        if len(self.ids) == self.boxes.shape[0]:
+            self.boxes = np.concatenate([self.boxes, np.empty_like(self.boxes)])
+        self._rows[obj_id] = len(self.ids)
+        self.boxes[len(self.ids)] = box
+        self.ids.append(obj_id)
+
+    def remove(self, obj_id):
+        if obj_id not in self._rows:
+            return
+        if self.grid is not None:
+            self._remove_from_grid(obj_id)
+        # Move the last box into the freed row to keep the array contiguous
+        row = self._rows.pop(obj_id)
+        last_id = self.ids.pop()
+        if last_id != obj_id:
+            self.boxes[row] = self.boxes[len(self.ids)]
+            self.ids[row] = last_id
+            self._rows[last_id] = row
+
+    def _get_rows(self, exclude=()):
+        excluded = set(self._rows[x] for x in exclude if x in self._rows)
+        return [row for row in range(len(self.ids)) if row not in excluded]
+
+    def get_collisions(self, boxes, exclude=()):
+        """
+        Returns a (k, N) boolean array telling which stored boxes collide with each of the k boxes
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        collisions = np.zeros((len(boxes), len(self.ids)), dtype=bool)
+        rows = self._get_nearby_rows(boxes, exclude)
+        if len(rows) > 0:
+            collisions[:, rows] = boxes_overlap(boxes, self.boxes[rows])
+        return collisions
+
+    def collides(self, boxes, exclude=()):
+        """
+        Returns a (k,) boolean array telling whether each of the k boxes collides with any stored box
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        rows = self._get_nearby_rows(boxes, exclude)
+        if len(rows) == 0:
+            return np.zeros(len(boxes), dtype=bool)
+        return boxes_overlap(boxes, self.boxes[rows]).any(axis=1)
+
+    def count(self, box, exclude=()):
+        """
+        Number of stored boxes that collide with the box
+        """
+        rows = self._get_nearby_rows(box, exclude)
+        if len(rows) == 0:
+            return 0
+        return int(boxes_overlap(box, self.boxes[rows]).sum())
+
+    def get_overlapping_ids(self, box, exclude=()):
+        """
+        Ids of the stored boxes colliding with the box
+        """
+        rows = self._get_nearby_rows(box, exclude)
+        if len(rows) == 0:
+            return []
+        hits = boxes_overlap(box, self.boxes[rows])[0]
+        return [self.ids[row] for row, hit in zip(rows, hits) if hit]
+
+    def get_clearance(self, boxes, exclude=()):
+        """
+        Distance in the xy-plane from each of the k boxes to the closest stored box, inf if there is none
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        others = self.boxes[self._get_rows(exclude)]
+        if len(others) == 0:
+            return np.full(len(boxes), np.inf)
+        gap_before = others[None, :, 0:4:2] - boxes[:, None, 1:4:2]
+        gap_after = boxes[:, None, 0:4:2] - others[None, :, 1:4:2]
+        gap = np.maximum(np.maximum(gap_before, gap_after), 0.0)
+        return np.sqrt((gap ** 2).sum(axis=2)).min(axis=1)
+
+    def get_free_cells(self, region, half_size, exclude=(), max_cells=20000):
+        """
+        Splits the region of possible box centers along the edges of the stored boxes grown by
+        half_size and returns the (M, 6) cells whose centers are collision free.
+        Returns None if the region would be split into more than max_cells cells
+        """
+        region = np.asarray(region, dtype=float)
+        half_size = np.asarray(half_size, dtype=float)
+        # A center inside a grown box means a collision, touching within the tolerance is fine
+        search_region = np.asarray(region, dtype=float).copy()
+        search_region[0::2] -= half_size
+        search_region[1::2] += half_size
+        grown = self.boxes[self._get_nearby_rows(search_region, exclude)].copy()
+        grown[:, 0::2] -= half_size - TOUCH_TOLERANCE
+        grown[:, 1::2] += half_size - TOUCH_TOLERANCE
+        lows, highs = np.minimum(region[0::2], region[1::2]), np.maximum(region[0::2], region[1::2])
+        grown = grown[((grown[:, 0::2] <= highs) & (grown[:, 1::2] >= lows)).all(axis=1)]
+
+        axis_cells = []
+        for axis in range(3):
+            if np.isclose(lows[axis], highs[axis]):
+                # Degenerate axis, keep the region bounds as they are
+                axis_cells.append(np.array([[region[2 * axis], region[2 * axis + 1]]]))
+                continue
+            edges = grown[:, 2 * axis:2 * axis + 2].ravel()
+            edges = np.unique(np.concatenate([[lows[axis], highs[axis]], edges[(edges > lows[axis]) & (edges < highs[axis])]]))
+            axis_cells.append(np.stack([edges[:-1], edges[1:]], axis=1))
+        if np.prod([len(c) for c in axis_cells]) > max_cells:
+            return None
+
+        x_idx, y_idx, z_idx = np.meshgrid(*[np.arange(len(c)) for c in axis_cells], indexing="ij")
+        cells = np.concatenate([
+            axis_cells[0][x_idx.ravel()], axis_cells[1][y_idx.ravel()], axis_cells[2][z_idx.ravel()]
+        ], axis=1)
+        if len(grown) == 0:
+            return cells
+        centers = (cells[:, 0::2] + cells[:, 1::2]) / 2
+        covered = ((centers[:, None, :] > grown[None, :, 0::2]) & (centers[:, None, :] < grown[None, :, 1::2])).all(axis=2).any(axis=1)
+        return cells[~covered]
@@ -0,0 +1,64 @@
+import networkx as nx
+
+from utils import ROOM_LAYOUT_ELEMENTS, get_node_conflicts, join_conflicts
+from scene_graph import SceneGraph
+
+
+class ConflictIndex:
+    """
+    The spatial conflicts of get_conflicts, kept per object of a ConstraintGraph. A correction
+    only checks again the objects whose conflicts can depend on the corrected object: the object,
+    its descendants, whose rotations and room layouts it passes on, its parents, which check their
+    children, and its siblings, whose conflicts describe their parents' children
+    """
+    def __init__(self, constraint_graph, scene_graph):
+        self.constraint_graph = constraint_graph
+        self.scene_graph = scene_graph if isinstance(scene_graph, SceneGraph) else SceneGraph(scene_graph)
+        self.node_layout = {}
+        self.node_conflicts = {}
+        self.checked = 0
+        self._check(self.constraint_graph.G.nodes())
+
+    def _check(self, nodes):
+        G = self.constraint_graph.G
+        nodes = set(nodes)
+        for node in self.constraint_graph.get_topological_ordering():
+            if node not in nodes:
+                continue
+            if node in ROOM_LAYOUT_ELEMENTS:
+                self.node_layout[node] = node
+            else:
+                self.node_conflicts[node] = get_node_conflicts(node, G, self.scene_graph, self.node_layout)
+                self.checked += 1
+
+    def get_dependents(self, node):
+        """
+        The objects whose conflicts can change when the placement or the facing of node changes
+        """
+        G = self.constraint_graph.G
+        if node not in G.nodes():
+            return {node}
+        dependents = {node}.union(nx.descendants(G, node))
+        for p in G.predecessors(node):
+            dependents.add(p)
+            dependents.update(G.successors(p))
+        return dependents
+
+    def update_object(self, obj):
+        """
+        Update the constraint graph and the scene graph index after the placement or the facing of
+        obj changed, and check the conflicts that depend on it again
+        """
+        node = obj["new_object_id"]
+        dependents = self.get_dependents(node)
+        self.constraint_graph.update_object(obj)
+        self.scene_graph.update(node)
+        dependents.update(self.get_dependents(node))
+        self._check(dependents)
+
+    def get_conflicts(self):
+        """
+        The conflicts in the order get_conflicts gives them for the graph as it is now, not in the
+        incrementally maintained order of the constraint graph
+        """
+        return join_conflicts(self.node_conflicts, list(nx.topological_sort(self.constraint_graph.G)), self.scene_graph)
@@ -1,380 +1,260 @@
-from copy import copy
+import numpy as np
+
+# Every bound of a constraint box is a linear combination of these features of the constraint.
+# The lengths and widths are the sizes seen from above, along x and y, so they are swapped for
+# objects rotated by 90 or 270 degrees. The offsets are how far the object goes in from the ends
+# of the side of obj_B it's placed along
+FEATURES = ["x_B", "y_B", "z_B", "length_B", "width_B", "height_B", "length_A", "width_A", "height_A", "offset_length", "offset_width", "room_x", "room_y", "room_z"]
+
+AXES = [
+    {"center" : "x_B", "size_B" : "length_B", "size_A" : "length_A", "offset" : "offset_length", "room" : "room_x"},
+    {"center" : "y_B", "size_B" : "width_B", "size_A" : "width_A", "offset" : "offset_width", "room" : "room_y"}
+]
+
+ROTATIONS = [0.0, 90.0, 180.0, 270.0]
+
+# Axis and sign of the side of obj_B the prepositions put obj_A on, when obj_B isn't rotated
+DIRECTIONS = {
+    "left of" : (0, -1),
+    "right of" : (0, +1),
+    "in front" : (1, +1),
+    "behind" : (1, -1)
+}
+
+# Signs of the size of the wall and of the size of obj_A in x_min, x_max, y_min and y_max for obj_A on a wall
+WALL_SIGNS = {
+    "west_wall" : (+1, +1, -1, +1, +1, +1, +1, -1),
+    "east_wall" : (-1, -1, -1, +1, -1, -1, +1, -1),
+    "north_wall" : (-1, +1, -1, -1, +1, -1, -1, -1),
+    "south_wall" : (-1, +1, +1, +1, +1, -1, +1, +1),
+}
+
+PREPOSITION_ALIASES = {
+    "in the middle of" : "on"
+}
+
+# How the bounds of a preposition are put in order and kept within the room after the transform:
+# whether the x, y and z bounds are put in order, and which of x_min, x_max, ..., z_max are clamped
+# to the room. x_min is clamped to length_A / 2 and x_max to [length_A / 2, room_x - length_A / 2]
+POSTPROCESSING = {
+    "on" : ((True, True, True), (True, True, True, True, True, True)),
+    "under" : ((True, True, True), (True, True, True, True, True, True)),
+    "left of" : ((True, True, False), (True, True, True, True, False, False)),
+    "right of" : ((True, True, False), (True, True, True, True, False, False)),
+    "in front" : ((True, True, False), (True, True, True, True, False, False)),
+    "behind" : ((True, True, False), (True, True, True, True, False, False)),
+    # z_min is clamped to [height_A / 2, room_z - height_A / 2] instead
+    "above" : ((True, True, False), (True, True, True, True, "both", False)),
+    "in the corner" : ((False, False, False), (False, False, False, False, False, False))
+}
+
+def get_row(**coefs):
+    row = np.zeros(len(FEATURES))
+    for name, coef in coefs.items():
+        row[FEATURES.index(name)] = coef
+    return row
+
+def get_direction(preposition, rotation):
+    # Rotating obj_B by 90 degrees turns its sides clockwise
+    axis, sign = DIRECTIONS[preposition]
+    for _ in range(ROTATIONS.index(rotation)):
+        axis, sign = (1, -sign) if axis == 0 else (0, sign)
+    return axis, sign
+
+def get_inside_bounds(axis):
+    # obj_A stays within obj_B
+    a = AXES[axis]
+    return (
+        get_row(**{a["center"] : 1, a["size_B"] : -0.5, a["size_A"] : 0.5}),
+        get_row(**{a["center"] : 1, a["size_B"] : 0.5, a["size_A"] : -0.5})
+    )
+
+def get_overlapping_bounds(axis):
+    # obj_A overlaps obj_B
+    a = AXES[axis]
+    return (
+        get_row(**{a["center"] : 1, a["size_B"] : -0.5, a["size_A"] : -0.5}),
+        get_row(**{a["center"] : 1, a["size_B"] : 0.5, a["size_A"] : 0.5})
+    )
+
+def get_side_bounds(axis):
+    # obj_A is along the side of obj_B
+    a = AXES[axis]
+    return (
+        get_row(**{a["center"] : 1, a["size_B"] : -0.5, a["offset"] : 1}),
+        get_row(**{a["center"] : 1, a["size_B"] : 0.5, a["offset"] : -1})
+    )
+
+def get_beyond_bounds(axis, sign, is_adjacent):
+    # obj_A is next to obj_B on the sign side, or anywhere up to the wall if it isn't adjacent
+    a = AXES[axis]
+    near = get_row(**{a["center"] : 1, a["size_B"] : 0.5 * sign, a["size_A"] : 0.5 * sign})
+    if is_adjacent:
+        far = near
+    elif sign > 0:
+        far = get_row(**{a["room"] : 1, a["size_A"] : -0.5})
+    else:
+        far = get_row(**{a["size_A"] : 0.5})
+    return (near, far) if sign > 0 else (far, near)
 
-def get_on_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
+def get_transform(preposition, rotation, layout, is_adjacent, is_on_floor):
     """
-    obj_A is on obj_B
+    The (6, len(FEATURES)) matrix that gives the box of the constraint from its features
     """
-    size_A = copy(obj_A["size_in_meters"])
-
-    
-    pos_B = obj_B["position"]
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-    if obj_B["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_B["length"], size_B["width"] = size_B["width"], size_B["length"]
-
-    if obj_B["new_object_id"] not in ["south_wall", "north_wall", "east_wall", "west_wall", "ceiling"]:
-        z_min = pos_B["z"] + size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2 
-        z_max = pos_B["z"] + size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2 
-        x_min = pos_B["x"] - size_B["length"] / 2 + size_A["length"] / 2
-        x_max = pos_B["x"] + size_B["length"] / 2 - size_A["length"] / 2
-        y_min = pos_B["y"] - size_B["width"] / 2 + size_A["width"] / 2
-        y_max = pos_B["y"] + size_B["width"] / 2 - size_A["width"] / 2
-    elif obj_B["new_object_id"] == "ceiling":
-        z_min = pos_B["z"] - size_B["height"] / 2 - size_A["height"] / 2
-        z_max = pos_B["z"] - size_B["height"] / 2 - size_A["height"] / 2
-        x_min = pos_B["x"] - size_B["length"] / 2 + size_A["length"] / 2
-        x_max = pos_B["x"] + size_B["length"] / 2 - size_A["length"] / 2
-        y_min = pos_B["y"] - size_B["width"] / 2 + size_A["width"] / 2
-        y_max = pos_B["y"] + size_B["width"] / 2 - size_A["width"] / 2
-    elif obj_B["new_object_id"] == "middle of the room":
-        z_min = pos_B["z"] + size_B["height"] / 2 + size_A["height"] / 2
-        z_max = pos_B["z"] + size_B["height"] / 2 + size_A["height"] / 2
-        x_min = pos_B["x"] - size_B["length"] / 2 + size_A["length"] / 2
-        x_max = pos_B["x"] + size_B["length"] / 2 - size_A["length"] / 2
-        y_min = pos_B["y"] - size_B["width"] / 2 + size_A["width"] / 2
-        y_max = pos_B["y"] + size_B["width"] / 2 - size_A["width"] / 2
+    on_floor = get_row(height_A=0.5)
+    if preposition == "on":
+        x, y = get_inside_bounds(0), get_inside_bounds(1)
+        if layout == "ceiling":
+            z = (get_row(z_B=1, height_B=-0.5, height_A=-0.5),) * 2
+        elif layout in WALL_SIGNS.keys():
+            signs = WALL_SIGNS[layout]
+            x = (get_row(x_B=1, length_B=0.5 * signs[0], length_A=0.5 * signs[4]), get_row(x_B=1, length_B=0.5 * signs[1], length_A=0.5 * signs[5]))
+            y = (get_row(y_B=1, width_B=0.5 * signs[2], width_A=0.5 * signs[6]), get_row(y_B=1, width_B=0.5 * signs[3], width_A=0.5 * signs[7]))
+            z = (get_row(z_B=1, height_B=-0.5, height_A=0.5), get_row(z_B=1, height_B=0.5, height_A=-0.5)) if not is_on_floor else (on_floor, on_floor)
+        else:
+            z = (get_row(z_B=1, height_B=0.5, height_A=0.5),) * 2 if not is_on_floor else (on_floor, on_floor)
+    elif preposition == "under":
+        x, y = get_overlapping_bounds(0), get_overlapping_bounds(1)
+        z = (on_floor, get_row(z_B=1, height_B=-0.5, height_A=-0.5) if not is_on_floor else on_floor)
+    elif preposition == "above":
+        x, y = get_overlapping_bounds(0), get_overlapping_bounds(1)
+        z = (get_row(z_B=1, height_B=0.5, height_A=0.5), get_row(room_z=1)) if not is_on_floor else (on_floor, on_floor)
+    elif preposition == "in the corner":
+        # obj_A is in front of the wall, between its ends
+        axis, sign = get_direction("in front", rotation)
+        bounds = [get_beyond_bounds(axis, sign, True), get_inside_bounds(1 - axis)]
+        x, y = bounds[axis], bounds[1 - axis]
+        z = (get_row(z_B=1, height_B=-0.5, height_A=0.5),) * 2 if not is_on_floor else (on_floor, on_floor)
     else:
-        z_min = pos_B["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2 
-        z_max = pos_B["z"] + size_B["height"] / 2 - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-        sign_map = {
-            "west_wall" : (+1, +1, -1, +1, +1, +1, +1, -1),
-            "east_wall" : (-1, -1, -1, +1, -1, -1, +1, -1),
-            "north_wall" : (-1, +1, -1, -1, +1, -1, -1, -1),
-            "south_wall" : (-1, +1, +1, +1, +1, -1, +1, +1),
-        }  
-        x_min = pos_B["x"] + sign_map[obj_B["new_object_id"]][0] * size_B["length"] / 2 + sign_map[obj_B["new_object_id"]][4] * size_A["length"] / 2 
-        x_max = pos_B["x"] + sign_map[obj_B["new_object_id"]][1] * size_B["length"] / 2 + sign_map[obj_B["new_object_id"]][5] * size_A["length"] / 2
-        y_min = pos_B["y"] + sign_map[obj_B["new_object_id"]][2] * size_B["width"] / 2 + sign_map[obj_B["new_object_id"]][6] * size_A["width"] / 2
-        y_max = pos_B["y"] + sign_map[obj_B["new_object_id"]][3] * size_B["width"] / 2 + sign_map[obj_B["new_object_id"]][7] * size_A["width"] / 2
-
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-    if z_min > z_max:
-        z_min, z_max = z_max, z_min
-
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-    z_max = max(size_A["height"] / 2, min(z_max, room_dimensions[2] - size_A["height"] / 2))
-    z_min = max(z_min, 0.0 + size_A["height"] / 2)
+        axis, sign = get_direction(preposition, rotation)
+        bounds = [get_beyond_bounds(axis, sign, is_adjacent), get_side_bounds(1 - axis)]
+        x, y = bounds[axis], bounds[1 - axis]
+        z = (get_row(z_B=1, height_B=-0.5, height_A=0.5), get_row(room_z=1, height_A=-0.5)) if not is_on_floor else (on_floor, on_floor)
+    return np.array([x[0], x[1], y[0], y[1], z[0], z[1]])
+
+def get_transform_key(preposition, obj_B, is_adjacent, is_on_floor):
+    preposition = PREPOSITION_ALIASES.get(preposition, preposition)
+    rotation = obj_B["rotation"]["z_angle"] if preposition not in ["on", "under"] else None
+    layout = obj_B["new_object_id"] if preposition == "on" and (obj_B["new_object_id"] in WALL_SIGNS.keys() or obj_B["new_object_id"] == "ceiling") else None
+    return (preposition, rotation, layout, bool(is_adjacent), bool(is_on_floor))
+
+def get_limits(clamp):
+    """
+    The (12, len(FEATURES)) matrix that gives the lower and the upper limits that the bounds are
+    clamped to, and the offsets added to them, infinite for the bounds that aren't clamped
+    """
+    half_sizes = [get_row(length_A=0.5), get_row(width_A=0.5), get_row(height_A=0.5)]
+    rooms = [get_row(room_x=1, length_A=-0.5), get_row(room_y=1, width_A=-0.5), get_row(room_z=1, height_A=-0.5)]
+    lower = [half_sizes[i // 2] for i in range(6)]
+    upper = [rooms[i // 2] for i in range(6)]
+    lower_offsets = [0.0 if x else -np.inf for x in clamp]
+    upper_offsets = [0.0 if x == "both" or (x and i % 2 == 1) else np.inf for i, x in enumerate(clamp)]
+    return np.array(lower + upper), np.array(lower_offsets + upper_offsets)
+
+# The transform table, for every preposition and, where they matter, rotation and room layout
+# element of obj_B. Every transform gives the box and the limits it's clamped to
+TRANSFORM_KEYS = []
+for preposition in POSTPROCESSING.keys():
+    rotations = ROTATIONS if preposition not in ["on", "under"] else [None]
+    layouts = [None, "ceiling"] + list(WALL_SIGNS.keys()) if preposition == "on" else [None]
+    for rotation in rotations:
+        for layout in layouts:
+            for is_adjacent in [True, False]:
+                for is_on_floor in [True, False]:
+                    TRANSFORM_KEYS.append((preposition, rotation, layout, is_adjacent, is_on_floor))
+TRANSFORM_INDEX = {key : i for i, key in enumerate(TRANSFORM_KEYS)}
+TRANSFORMS = np.array([np.concatenate([get_transform(*key), get_limits(POSTPROCESSING[key[0]][1])[0]]) for key in TRANSFORM_KEYS])
+LIMIT_OFFSETS = np.array([get_limits(POSTPROCESSING[key[0]][1])[1] for key in TRANSFORM_KEYS])
+ORDER_BOUNDS = np.array([np.repeat(POSTPROCESSING[key[0]][0], 2) for key in TRANSFORM_KEYS])
+
+def get_constraint_boxes(constraints, room_dimensions, positions=None):
+    """
+    Boxes of the positions of obj_A that satisfy the constraints, as a (k, 6) array of
+    (x_min, x_max, y_min, y_max, z_min, z_max). Every constraint is an (obj_A, obj_B, preposition,
+    is_adjacent, is_on_floor) tuple for obj_A being preposition obj_B, so the constraints of several
+    objects can be computed at once. positions is a (k, 3) array of positions of the obj_B to use
+    instead of the ones they have
+    """
+    if len(constraints) == 0:
+        return np.zeros((0, 6))
+    features = []
+    indices = []
+    for i, (obj_A, obj_B, preposition, is_adjacent, is_on_floor) in enumerate(constraints):
+        size_A, size_B = obj_A["size_in_meters"], obj_B["size_in_meters"]
+        length_A, width_A = size_A["length"], size_A["width"]
+        if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
+            length_A, width_A = width_A, length_A
+        length_B, width_B = size_B["length"], size_B["width"]
+        if obj_B["rotation"]["z_angle"] in [90.0, 270.0]:
+            length_B, width_B = width_B, length_B
+        if positions is None:
+            x_B, y_B, z_B = obj_B["position"]["x"], obj_B["position"]["y"], obj_B["position"]["z"]
+        else:
+            x_B, y_B, z_B = positions[i]
+        features.append((
+            x_B, y_B, z_B, length_B, width_B, size_B["height"], length_A, width_A, size_A["height"],
+            ((is_adjacent * length_A) - (not is_adjacent * length_A)) / 2,
+            ((is_adjacent * width_A) - (not is_adjacent * width_A)) / 2,
+            room_dimensions[0], room_dimensions[1], room_dimensions[2]
+        ))
+        indices.append(TRANSFORM_INDEX[get_transform_key(preposition, obj_B, is_adjacent, is_on_floor)])
+
+    features = np.array(features, dtype=float).reshape(-1, len(FEATURES), 1)
+    values = np.matmul(TRANSFORMS.take(indices, axis=0), features).reshape(-1, 18)
+    boxes = values[:, :6]
+    limits = values[:, 6:] + LIMIT_OFFSETS.take(indices, axis=0)
+
+    # Put the bounds in order and keep obj_A within the room
+    boxes = np.where(ORDER_BOUNDS.take(indices, axis=0), np.sort(boxes.reshape(-1, 3, 2), axis=2).reshape(-1, 6), boxes)
+    return np.maximum(limits[:, :6], np.minimum(boxes, limits[:, 6:]))
+
+def get_constraint_box(obj_A, obj_B, preposition, is_adjacent, is_on_floor, room_dimensions):
+    return tuple(get_constraint_boxes([(obj_A, obj_B, preposition, is_adjacent, is_on_floor)], room_dimensions)[0].tolist())
 
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
+def get_on_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
+    """
+    obj_A is on obj_B
+    """
+    return get_constraint_box(obj_A, obj_B, "on", is_adjacent, is_on_floor, room_dimensions)
 
 def get_under_contraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is under obj_B
     """
-
-    size_A = copy(obj_A["size_in_meters"])
-    
-    pos_B = obj_B["position"]
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-    if obj_B["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_B["length"], size_B["width"] = size_B["width"], size_B["length"]
-
-    z_min = size_A["height"] / 2
-    z_max = pos_B["z"] - size_B["height"] / 2 - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    x_min = pos_B["x"] - size_B["length"] / 2 - size_A["length"] / 2
-    x_max = pos_B["x"] + size_B["length"] / 2 + size_A["length"] / 2
-    y_min = pos_B["y"] - size_B["width"] / 2 - size_A["width"] / 2
-    y_max = pos_B["y"] + size_B["width"] / 2 + size_A["width"] / 2
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-    if z_min > z_max:
-        z_min, z_max = z_max, z_min
-    
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-    z_max = max(size_A["height"] / 2, min(z_max, room_dimensions[2] - size_A["height"] / 2))
-    z_min = max(z_min, 0.0 + size_A["height"] / 2)
-    
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
-
+    return get_constraint_box(obj_A, obj_B, "under", is_adjacent, is_on_floor, room_dimensions)
 
 def get_left_of_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is left of obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-
-    z_min = obj_B["position"]["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    z_max = room_dimensions[2] - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2 if is_adjacent else size_A["length"] / 2
-        x_max = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2 if is_adjacent else room_dimensions[1] - size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0:
-        x_min = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2 if is_adjacent else room_dimensions[0] - size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 if is_adjacent else size_A["width"] / 2
-        y_max = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-
-    
-    return (x_min, x_max, y_min, y_max, z_min, z_max)           
-
+    return get_constraint_box(obj_A, obj_B, "left of", is_adjacent, is_on_floor, room_dimensions)
 
 def get_right_of_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is right of obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-    z_min = obj_B["position"]["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    z_max = room_dimensions[2] - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_min = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2 if is_adjacent else room_dimensions[0] - size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 if is_adjacent else size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2 if is_adjacent else size_A["length"] / 2
-        x_max = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2 
-        y_min = obj_B["position"]["y"] + size_B["width"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] - size_B["width"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_min = obj_B["position"]["x"] + size_B["width"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] - size_B["width"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2 if is_adjacent else room_dimensions[1] - size_A["width"] / 2
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-    
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
+    return get_constraint_box(obj_A, obj_B, "right of", is_adjacent, is_on_floor, room_dimensions)
 
 def get_in_front_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is in front of obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
+    return get_constraint_box(obj_A, obj_B, "in front", is_adjacent, is_on_floor, room_dimensions)
 
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-
-    z_min = obj_B["position"]["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    z_max = room_dimensions[2] - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 if is_adjacent else room_dimensions[1] - size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_min = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 if is_adjacent else room_dimensions[0] - size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0 :
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2 if is_adjacent else size_A["width"] / 2
-        y_max = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2 
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 if is_adjacent else size_A["length"] / 2
-        x_max = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-    
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-    
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
-    
 def get_behind_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is behind obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-
-    z_min = obj_B["position"]["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    z_max = room_dimensions[2] - size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2 if is_adjacent else size_A["width"] / 2
-        y_max = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2 
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 if is_adjacent else size_A["length"] / 2
-        x_max = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 + ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 - ((is_adjacent * size_A["length"]) - (not is_adjacent * size_A["length"])) / 2
-        y_min = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 if is_adjacent else room_dimensions[1] - size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_min = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 if is_adjacent else room_dimensions[0] - size_A["length"] / 2
-        y_min = obj_B["position"]["y"] + size_B["length"] / 2 - ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-        y_max = obj_B["position"]["y"] - size_B["length"] / 2 + ((is_adjacent * size_A["width"]) - (not is_adjacent * size_A["width"])) / 2
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
+    return get_constraint_box(obj_A, obj_B, "behind", is_adjacent, is_on_floor, room_dimensions)
 
 def get_above_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is above obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-
-    z_min = obj_B["position"]["z"] + size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-    z_max = room_dimensions[2] if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0:
-        x_min = obj_B["position"]["x"] - size_B["length"] / 2 - size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["length"] / 2 + size_A["length"] / 2
-        y_min = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2
-        y_max = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_min = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        x_max = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        y_min = obj_B["position"]["y"] - size_B["length"] / 2 - size_A["width"] / 2 
-        y_max = obj_B["position"]["y"] + size_B["length"] / 2 + size_A["width"] / 2
-    
-    if x_min > x_max:
-        x_min, x_max = x_max, x_min
-    if y_min > y_max:
-        y_min, y_max = y_max, y_min
-    
-    x_max = max(size_A["length"] / 2, min(x_max, room_dimensions[0] - size_A["length"] / 2))
-    x_min = max(x_min, 0.0 + size_A["length"] / 2)
-    y_max = max(size_A["width"] / 2, min(y_max, room_dimensions[1] - size_A["width"] / 2))
-    y_min = max(y_min, 0.0 + size_A["width"] / 2)
-    z_min = max(size_A["height"] / 2, min(z_min, room_dimensions[2] - size_A["height"] / 2))
-    z_min = max(z_min, 0.0 + size_A["height"] / 2)
-
-    return (x_min, x_max, y_min, y_max, z_min, z_max)
-
+    return get_constraint_box(obj_A, obj_B, "above", is_adjacent, is_on_floor, room_dimensions)
 
 def get_in_corner_constraint(obj_A, obj_B, is_adjacent, is_on_floor, room_dimensions):
     """
     obj_A is in the corner of obj_B
     """
-    size_A = copy(obj_A["size_in_meters"])
-    size_B = copy(obj_B["size_in_meters"])
-
-    if obj_A["rotation"]["z_angle"] in [90.0, 270.0]:
-        size_A["length"], size_A["width"] = size_A["width"], size_A["length"]
-
-
-    z_min = obj_B["position"]["z"] - size_B["height"] / 2 + size_A["height"] / 2 if not is_on_floor else size_A["height"] / 2
-
-    if obj_B["rotation"]["z_angle"] == 0.0:
-        x_1 = obj_B["position"]["x"] - size_B["length"] / 2 + size_A["length"] / 2 
-        x_2 = obj_B["position"]["x"] + size_B["length"] / 2 - size_A["length"] / 2 
-        y_1 = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 
-        y_2 = obj_B["position"]["y"] + size_B["width"] / 2 + size_A["width"] / 2 
-    elif obj_B["rotation"]["z_angle"] == 90.0:
-        x_1 = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        x_2 = obj_B["position"]["x"] + size_B["width"] / 2 + size_A["length"] / 2 
-        y_1 = obj_B["position"]["y"] - size_B["length"] / 2 + size_A["width"] / 2 
-        y_2 = obj_B["position"]["y"] + size_B["length"] / 2 - size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 180.0:
-        x_1 = obj_B["position"]["x"] - size_B["length"] / 2 + size_A["length"] / 2 
-        x_2 = obj_B["position"]["x"] + size_B["length"] / 2 - size_A["length"] / 2 
-        y_1 = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2 
-        y_2 = obj_B["position"]["y"] - size_B["width"] / 2 - size_A["width"] / 2
-    elif obj_B["rotation"]["z_angle"] == 270.0:
-        x_1 = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        x_2 = obj_B["position"]["x"] - size_B["width"] / 2 - size_A["length"] / 2 
-        y_1 = obj_B["position"]["y"] - size_B["length"] / 2 + size_A["width"] / 2 
-        y_2 = obj_B["position"]["y"] + size_B["length"] / 2 - size_A["width"] / 2
-    
-    return (x_1, x_2, y_1, y_2, z_min, z_min)
\ No newline at end of file
+    return get_constraint_box(obj_A, obj_B, "in the corner", is_adjacent, is_on_floor, room_dimensions)
@@ -0,0 +1,132 @@
+import networkx as nx
+
+from utils import ROOM_LAYOUT_ELEMENTS
+
+
+class ConstraintGraph:
+    """
+    Placement constraint graph that is built once and kept up to date while the
+    scene graph is edited. Edges go from the parent (room layout element or object)
+    to the object that is placed relative to it, like in build_graph
+    """
+    def __init__(self, scene_graph=()):
+        self.G = nx.DiGraph()
+        for obj in scene_graph:
+            if "placement" in obj.keys():
+                self._add_edges(obj)
+        self.refresh()
+
+    def _add_edges(self, obj):
+        if obj["new_object_id"] not in self.G.nodes():
+            self.G.add_node(obj["new_object_id"])
+        obj_scene_graph = obj["placement"]
+        for constraint in obj_scene_graph["room_layout_elements"]:
+            if constraint["layout_element_id"] not in self.G.nodes():
+                self.G.add_node(constraint["layout_element_id"])
+            self.G.add_edge(constraint["layout_element_id"], obj["new_object_id"], weight={"preposition" : constraint["preposition"], "adjacency" : True})
+        for constraint in obj_scene_graph["objects_in_room"]:
+            if constraint["object_id"] not in self.G.nodes():
+                self.G.add_node(constraint["object_id"])
+            self.G.add_edge(constraint["object_id"], obj["new_object_id"], weight={"preposition" : constraint["preposition"], "adjacency" : constraint["is_adjacent"]})
+
+    def refresh(self):
+        """
+        Recompute the topological order and the depths of the whole graph.
+        Needed only after G was edited directly
+        """
+        self._order = list(nx.topological_sort(self.G))
+        self._rank = {node : i for i, node in enumerate(self._order)}
+        self._depth = {}
+        for node in self._order:
+            self._depth[node] = self._get_node_depth(node)
+
+    def _get_node_depth(self, node):
+        # Depth is the number of edges from the closest room layout element
+        if node in ROOM_LAYOUT_ELEMENTS:
+            return 0
+        parent_depths = [self._depth[p] for p in self.G.predecessors(node) if p in self._depth]
+        return min(parent_depths) + 1 if len(parent_depths) > 0 else 1
+
+    def _reorder(self, u, v):
+        # The edge u -> v was added while v comes before u, only the nodes
+        # ranked between v and u have to move (Pearce-Kelly)
+        lower, upper = self._rank[v], self._rank[u]
+
+        forward = set()
+        stack = [v]
+        while stack:
+            node = stack.pop()
+            if node == u:
+                raise nx.NetworkXUnfeasible(f"Adding the edge {u} -> {v} creates a cycle!")
+            if node in forward:
+                continue
+            forward.add(node)
+            stack.extend([s for s in self.G.successors(node) if self._rank[s] <= upper])
+
+        backward = set()
+        stack = [u]
+        while stack:
+            node = stack.pop()
+            if node in backward:
+                continue
+            backward.add(node)
+            stack.extend([p for p in self.G.predecessors(node) if self._rank[p] >= lower])
+
+        backward = sorted(backward, key=lambda x : self._rank[x])
+        forward = sorted(forward, key=lambda x : self._rank[x])
+        slots = sorted(self._rank[x] for x in backward + forward)
+        for node, slot in zip(backward + forward, slots):
+            self._order[slot] = node
+            self._rank[node] = slot
+
+    def _repair(self, node):
+        # Nodes that are new to the graph have no parents yet, so they can go first
+        new_nodes = [n for n in self.G.nodes() if n not in self._rank]
+        if len(new_nodes) > 0:
+            self._order = new_nodes + self._order
+            self._rank = {n : i for i, n in enumerate(self._order)}
+        for parent in list(self.G.predecessors(node)):
+            if self._rank[parent] > self._rank[node]:
+                self._reorder(parent, node)
+        self._update_depths([node] + list(new_nodes))
+
+    def _update_depths(self, nodes):
+        affected = set()
+        for node in nodes:
+            if node in self.G.nodes():
+                affected.add(node)
+                affected.update(nx.descendants(self.G, node))
+        for node in sorted(affected, key=lambda x : self._rank[x]):
+            self._depth[node] = self._get_node_depth(node)
+
+    def update_object(self, obj):
+        """
+        Replace the incoming edges of the object with the ones in its placement
+        """
+        node = obj["new_object_id"]
+        if node in self.G.nodes():
+            self.G.remove_edges_from(list(self.G.in_edges(node)))
+        self._add_edges(obj)
+        self._repair(node)
+
+    def remove_object(self, obj_id):
+        """
+        Remove the object and its edges from the graph
+        """
+        if obj_id not in self.G.nodes():
+            return
+        children = list(self.G.successors(obj_id))
+        self.G.remove_node(obj_id)
+        self._order.remove(obj_id)
+        self._rank = {n : i for i, n in enumerate(self._order)}
+        del self._depth[obj_id]
+        self._update_depths(children)
+
+    def get_topological_ordering(self):
+        return list(self._order)
+
+    def get_depth(self):
+        """
+        Depth of every object, room layout elements excluded
+        """
+        return {k: v for k, v in self._depth.items() if k not in ROOM_LAYOUT_ELEMENTS}
@@ -1,12 +1,14 @@
 import autogen
 from autogen import AssistantAgent, UserProxyAgent
 from copy import deepcopy
-from jsonschema import validate
 import json
 import re
 
-from schemas import layout_corrector_schema, deletion_schema
+from schemas import layout_corrector_schema, deletion_schema, get_schema_errors, get_error_message
 from agents import is_termination_msg
+from llm_cache import attach_response_cache
+from local_llm import attach_local_backend
+from json_repair import attach_json_repair, repair_corrected_object
 
 
 class JSONSchemaAgent(UserProxyAgent):
@@ -27,19 +29,20 @@ class JSONSchemaAgent(UserProxyAgent):
 
         json_obj_new = json.loads(match.group(1))
 
-        is_success = False
-        try:
-            validate(instance=json_obj_new, schema=layout_corrector_schema)
+        # Every error goes back to the LLM in one reply
+        feedback = []
+        for e in get_schema_errors(json_obj_new, layout_corrector_schema):
+            error_feedback = get_error_message(e)
+            if e.validator == "enum":
+                if e.validator_value == preps_objs:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
+                elif e.validator_value == preps_layout:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
+            feedback.append(error_feedback)
+
+        if len(feedback) == 0:
             return "SUCCESS"
-        except Exception as e:
-            feedback = str(e)
-            if "enum" in feedback:
-                if any(prep in feedback for prep in preps_objs):
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
-                elif any(prep in feedback for prep in preps_layout):
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
-        
-        return feedback
+        return "\n".join(feedback)
 
 
 # Load the Groq Llama models for both vision and language tasks
@@ -59,7 +62,7 @@ config_list_llama_language = autogen.config_list_from_json(
 
 # Configuration for the Llama vision model
 llama_vision_config = {
-    "cache_seed": 42,
+    "cache_seed": None,  # Responses are cached by llm_cache
     "temperature": 0.0,
     "config_list": config_list_llama_vision,
     "timeout": 600,
@@ -120,5 +123,12 @@ def get_corrector_agents():
         """
     )
 
+    # Answer repeated requests from the response cache, or from the local backend when there is one
+    for agent in (spatial_corrector_agent, object_deletion_agent):
+        attach_response_cache(agent)
+        attach_local_backend(agent)
+    # Fix the mechanical schema errors locally instead of in another round with the debugger
+    attach_json_repair(spatial_corrector_agent, repair_corrected_object, fenced=True)
+
     # Return the agents
     return user_proxy, json_schema_debugger, spatial_corrector_agent, object_deletion_agent
@@ -0,0 +1,166 @@
+import json
+import re
+
+from autogen import Agent
+
+from utils import ROOM_LAYOUT_ELEMENTS
+
+LAYOUT_PREPOSITIONS = ["on", "in the corner"]
+OBJECT_PREPOSITIONS = ["on", "left of", "right of", "in front", "behind", "under", "above"]
+
+# Spellings of the prepositions and layout elements the LLMs use, after lowercasing and
+# replacing underscores with spaces
+PREPOSITION_ALIASES = {
+    "on top of" : "on",
+    "on top" : "on",
+    "against" : "on",
+    "along" : "on",
+    "in corner" : "in the corner",
+    "corner" : "in the corner",
+    "at the corner" : "in the corner",
+    "left" : "left of",
+    "to the left of" : "left of",
+    "on the left of" : "left of",
+    "right" : "right of",
+    "to the right of" : "right of",
+    "on the right of" : "right of",
+    "in front of" : "in front",
+    "front" : "in front",
+    "behind of" : "behind",
+    "back" : "behind",
+    "below" : "under",
+    "beneath" : "under",
+    "underneath" : "under",
+    "over" : "above"
+}
+
+LAYOUT_ELEMENT_ALIASES = {
+    "middle" : "middle of the room",
+    "center" : "middle of the room",
+    "center of the room" : "middle of the room",
+    "floor" : "middle of the room"
+}
+
+def get_normalized(value, allowed, aliases):
+    """
+    The allowed spelling of value, or value itself if it isn't an obvious variant of an allowed one
+    """
+    if not isinstance(value, str) or value in allowed:
+        return value
+    key = " ".join(value.lower().replace("_", " ").replace("-", " ").split())
+    key = aliases.get(key, key)
+    for x in allowed:
+        if key == x.replace("_", " "):
+            return x
+    return value
+
+def repair_placement(placement, object_ids=()):
+    """
+    Fixes the prepositions and the layout element ids of a placement and moves the objects listed
+    as room layout elements to the objects in the room
+    """
+    layout_elements = []
+    for elem in placement.get("room_layout_elements", []):
+        elem_id = get_normalized(elem.get("layout_element_id"), ROOM_LAYOUT_ELEMENTS, LAYOUT_ELEMENT_ALIASES)
+        if elem_id in object_ids:
+            placement.setdefault("objects_in_room", []).append({
+                "object_id" : elem_id,
+                "preposition" : get_normalized(elem.get("preposition"), OBJECT_PREPOSITIONS, PREPOSITION_ALIASES),
+                "is_adjacent" : True
+            })
+            continue
+        elem["layout_element_id"] = elem_id
+        elem["preposition"] = get_normalized(elem.get("preposition"), LAYOUT_PREPOSITIONS, PREPOSITION_ALIASES)
+        layout_elements.append(elem)
+    if "room_layout_elements" in placement:
+        placement["room_layout_elements"] = layout_elements
+    for x in placement.get("objects_in_room", []):
+        if "object_id" not in x and "new_object_id" in x:
+            x["object_id"] = x.pop("new_object_id")
+        x["preposition"] = get_normalized(x.get("preposition"), OBJECT_PREPOSITIONS, PREPOSITION_ALIASES)
+
+def repair_objects_in_room(json_obj):
+    """
+    Repairs the {"objects_in_room" : [...]} of the engineer
+    """
+    objects = json_obj.get("objects_in_room")
+    if not isinstance(objects, list):
+        return
+    for obj in objects:
+        if isinstance(obj, dict) and "new_object_id" not in obj and "object_id" in obj:
+            obj["new_object_id"] = obj.pop("object_id")
+    object_ids = [obj.get("new_object_id") for obj in objects if isinstance(obj, dict)]
+    for obj in objects:
+        if isinstance(obj, dict) and isinstance(obj.get("placement"), dict):
+            obj["placement"].setdefault("objects_in_room", [])
+            repair_placement(obj["placement"], object_ids)
+
+def repair_corrected_object(json_obj):
+    """
+    Repairs the {"corrected_object" : {...}} of the spatial corrector
+    """
+    obj = json_obj.get("corrected_object")
+    if isinstance(obj, dict) and isinstance(obj.get("placement"), dict):
+        repair_placement(obj["placement"])
+
+def repair_children_objects(json_obj):
+    """
+    Repairs the {"children_objects" : [...]} of the layout refiner
+    """
+    if isinstance(json_obj.get("children_objects"), dict) and "items" in json_obj["children_objects"]:
+        json_obj["children_objects"] = json_obj["children_objects"]["items"]
+    if not isinstance(json_obj.get("children_objects"), list):
+        return
+    for child in json_obj["children_objects"]:
+        if not isinstance(child, dict) or not isinstance(child.get("placement"), dict):
+            continue
+        for x in child["placement"].get("children_objects", []):
+            if isinstance(x, dict):
+                x["preposition"] = get_normalized(x.get("preposition"), OBJECT_PREPOSITIONS, PREPOSITION_ALIASES)
+
+def repair_response(content, repair, fenced=False):
+    """
+    Applies repair to the JSON of a response, in a ```json block if fenced. The response is returned
+    as it is if it has no JSON or nothing was repaired, the schema debugger then gives the LLM
+    another turn if it's still invalid
+    """
+    if fenced:
+        match = re.search(r'```json\s*([^`]+)\s*```', content, re.DOTALL)
+        if not match:
+            return content
+        json_str = match.group(1)
+    else:
+        json_str = re.sub(r'^\s*```(json)?|```\s*$', '', content)
+    try:
+        json_obj = json.loads(json_str)
+    except json.JSONDecodeError:
+        return content
+    if not isinstance(json_obj, dict):
+        return content
+
+    original = json.dumps(json_obj, sort_keys=True)
+    repair(json_obj)
+    if json.dumps(json_obj, sort_keys=True) == original and (fenced or json_str == content):
+        return content
+    repaired = json.dumps(json_obj)
+    if fenced:
+        return content[:match.start(1)] + repaired + "\n" + content[match.end(1):]
+    return repaired
+
+def repaired_reply(recipient, messages=None, sender=None, config=None):
+    """
+    Reply function that repairs the response the agent's other reply functions give
+    """
+    repair, fenced = config
+    reply = recipient.generate_reply(messages, sender, exclude=[repaired_reply])
+    if isinstance(reply, str):
+        reply = repair_response(reply, repair, fenced)
+    return True, reply
+
+def attach_json_repair(agent, repair, fenced=False):
+    """
+    Make the agent repair the mechanical schema errors of its responses before the schema
+    debugger sees them
+    """
+    agent.register_reply([Agent, None], repaired_reply, config=(repair, fenced))
+    return agent
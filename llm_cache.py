@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from autogen import Agent, ConversableAgent
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite")
+
+def get_cache_key(model, system_message, messages, temperature):
+    """
+    Content address of an LLM call: the sha256 of its model, system message, messages and temperature
+    """
+    content = json.dumps({
+        "model" : model,
+        "system_message" : system_message,
+        "messages" : [{key : message.get(key) for key in ("role", "name", "content", "function_call")} for message in messages],
+        "temperature" : temperature
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache:
+    """
+    LLM response cache stored in a SQLite file, which can live on a shared drive to share the
+    responses between runs and hosts. Holds at most max_entries responses, evicting the least
+    recently used ones. Calls with a non-zero temperature bypass the cache unless cache_sampled is set,
+    since their responses are meant to vary
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=10000, cache_sampled=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The agents of concurrent chats share the cache
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def is_bypassed(self, temperature):
+        """
+        Whether a call with this temperature skips the cache, counting the bypassed calls
+        """
+        bypassed = not self.cache_sampled and temperature not in (None, 0, 0.0)
+        with self._lock:
+            self.bypassed += bypassed
+        return bypassed
+
+    def get(self, key):
+        """
+        The cached response or None, counting the hits and misses
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def set(self, key, response):
+        with self._lock:
+            with self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO responses (key, response, last_used) VALUES (?, ?, ?)", (key, json.dumps(response), time.time()))
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM responses")
+
+    def get_stats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "bypassed" : self.bypassed, "entries" : len(self)}
+
+
+response_cache = None
+
+def get_response_cache():
+    """
+    The response cache shared by the agents, a SQLiteResponseCache at DEFAULT_CACHE_PATH unless
+    set_response_cache was called
+    """
+    global response_cache
+    if response_cache is None:
+        response_cache = SQLiteResponseCache()
+    return response_cache
+
+def set_response_cache(cache):
+    """
+    Replace the shared response cache. Any object with the get, set and is_bypassed methods of
+    SQLiteResponseCache works, False disables caching
+    """
+    global response_cache
+    response_cache = cache
+
+def cached_oai_reply(recipient, messages=None, sender=None, config=None):
+    """
+    Reply function that answers from the response cache before calling the LLM
+    """
+    cache = get_response_cache()
+    if cache is False or recipient.client is None:
+        return False, None
+    if messages is None:
+        messages = recipient._oai_messages[sender]
+    temperature = recipient.llm_config.get("temperature")
+    if cache.is_bypassed(temperature):
+        return False, None
+
+    model = [x.get("model") for x in recipient.llm_config.get("config_list", [])]
+    key = get_cache_key(model, recipient.system_message, messages, temperature)
+    response = cache.get(key)
+    if response is not None:
+        return True, response
+    final, response = recipient.generate_oai_reply(messages, sender, config)
+    if final and response is not None:
+        cache.set(key, response)
+    return final, response
+
+def attach_response_cache(agent):
+    """
+    Make the agent answer from the shared response cache. The agent's llm_config should have
+    cache_seed set to None so that autogen's own cache isn't used as well
+    """
+    # Right before the LLM call, the termination and human reply checks still come first
+    position = next(i for i, x in enumerate(agent._reply_func_list) if x["reply_func"] is ConversableAgent.generate_oai_reply)
+    agent.register_reply([Agent, None], cached_oai_reply, position=position)
+    return agent
@@ -0,0 +1,108 @@
+import atexit
+import json
+import os
+import random
+import threading
+import time
+
+from autogen import Agent, ConversableAgent
+
+from llm_cache import cached_oai_reply
+from transcripts import TranscriptRecorder, TranscriptReplayer
+
+
+class LocalLLM:
+    """
+    In-process stand-in for the LLMs, to run and benchmark the pipeline without network access.
+    The responses are given by agent name, either as a list, the n-th response answering the
+    agent's n-th turn in a chat and the last one answering any later turn, or as a function of the
+    agent and the messages. Responses that aren't strings are sent as JSON. Every call waits
+    latency seconds, plus up to jitter seconds more, to simulate the round-trip
+    """
+    def __init__(self, responses, latency=0.0, jitter=0.0, seed=0):
+        self.responses = responses
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, path, **kwargs):
+        """
+        Reads the canned responses from a {agent name : [response, ...]} JSON file
+        """
+        with open(path, "r") as file:
+            return cls(json.load(file), **kwargs)
+
+    def get_response(self, agent, messages):
+        if agent.name not in self.responses:
+            raise KeyError(f"No canned responses for the agent {agent.name}")
+        responses = self.responses[agent.name]
+        if callable(responses):
+            response = responses(agent, messages)
+        else:
+            # The agent's own messages have the assistant role, the turn doesn't depend on the other chats
+            turn = sum(1 for message in messages if message.get("role") == "assistant")
+            response = responses[min(turn, len(responses) - 1)]
+
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self.jitter * self._rng.random()
+        if delay > 0:
+            time.sleep(delay)
+        return response if isinstance(response, str) else json.dumps(response)
+
+
+local_backend = None
+_backend_lock = threading.Lock()
+
+def get_local_backend():
+    """
+    The local backend answering instead of the LLMs, or False if the LLMs are used. Unless
+    set_local_backend was called, it's read from the environment: IDESIGN_LOCAL_LLM is a JSON file of
+    canned responses, with the latency in seconds in IDESIGN_LOCAL_LLM_LATENCY, IDESIGN_REPLAY a
+    transcript to replay and IDESIGN_RECORD the transcript to record the responses in
+    """
+    global local_backend
+    with _backend_lock:
+        if local_backend is None:
+            path = os.environ.get("IDESIGN_LOCAL_LLM")
+            latency = float(os.environ.get("IDESIGN_LOCAL_LLM_LATENCY", 0.0))
+            backend = LocalLLM.from_json(path, latency=latency) if path else None
+            if os.environ.get("IDESIGN_REPLAY"):
+                backend = TranscriptReplayer(os.environ["IDESIGN_REPLAY"])
+            if os.environ.get("IDESIGN_RECORD"):
+                backend = TranscriptRecorder(os.environ["IDESIGN_RECORD"], backend)
+                atexit.register(backend.close)
+            local_backend = backend if backend is not None else False
+    return local_backend
+
+def set_local_backend(backend):
+    """
+    Replace the local backend. Any object with the get_response method of LocalLLM works,
+    False uses the LLMs and None reads the environment again
+    """
+    global local_backend
+    local_backend = backend
+
+def local_oai_reply(recipient, messages=None, sender=None, config=None):
+    """
+    Reply function that answers from the local backend, if there is one, instead of the LLM
+    """
+    backend = get_local_backend()
+    if backend is False:
+        return False, None
+    if messages is None:
+        messages = recipient._oai_messages[sender]
+    return True, backend.get_response(recipient, messages)
+
+def attach_local_backend(agent):
+    """
+    Make the agent answer from the local backend when there is one. Goes before the response cache,
+    so that the canned responses are never cached
+    """
+    reply_funcs = [x["reply_func"] for x in agent._reply_func_list]
+    llm_reply = cached_oai_reply if cached_oai_reply in reply_funcs else ConversableAgent.generate_oai_reply
+    agent.register_reply([Agent, None], local_oai_reply, position=reply_funcs.index(llm_reply))
+    return agent
@@ -1,11 +1,13 @@
 import autogen
 from autogen import AssistantAgent, UserProxyAgent
 from copy import deepcopy
-from jsonschema import validate
 import json
 
-from schemas import layout_refiner_schema
+from schemas import layout_refiner_schema, get_schema_errors, get_error_message
 from agents import is_termination_msg
+from llm_cache import attach_response_cache
+from local_llm import attach_local_backend
+from json_repair import attach_json_repair, repair_children_objects
 
 
 class JSONSchemaAgent(UserProxyAgent):
@@ -21,17 +23,20 @@ class JSONSchemaAgent(UserProxyAgent):
         if "items" in json_obj_new["children_objects"]:
             json_obj_new = {"children_objects": json_obj_new["children_objects"]["items"]}
 
-        try:
-            validate(instance=json_obj_new, schema=layout_refiner_schema)
+        # Every error goes back to the LLM in one reply
+        feedback = []
+        for e in get_schema_errors(json_obj_new, layout_refiner_schema):
+            error_feedback = get_error_message(e)
+            if e.validator == "enum":
+                if e.validator_value == preps_objs:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
+                elif e.validator_value == preps_layout:
+                    error_feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
+            feedback.append(error_feedback)
+
+        if len(feedback) == 0:
             return "SUCCESS"
-        except Exception as e:
-            feedback = str(e)
-            if "enum" in feedback:
-                if any(prep in feedback for prep in preps_objs):
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_objs}."
-                elif any(prep in feedback for prep in preps_layout):
-                    feedback += f" Change the preposition {e.instance} to something suitable from {preps_layout}."
-            return feedback
+        return "\n".join(feedback)
 
 
 # Load Groq Llama model configurations for vision and language tasks
@@ -51,7 +56,7 @@ config_list_llama_language = autogen.config_list_from_json(
 
 # General configuration for Llama vision model
 llama_vision_config = {
-    "cache_seed": 42,
+    "cache_seed": None,  # Responses are cached by llm_cache
     "temperature": 0.0,
     "config_list": config_list_llama_vision,
     "timeout": 600,
@@ -140,5 +145,11 @@ def get_refiner_agents():
         """
     )
 
+    # Answer repeated requests from the response cache, or from the local backend when there is one
+    attach_response_cache(layout_refiner)
+    attach_local_backend(layout_refiner)
+    # Fix the mechanical schema errors locally instead of in another round with the debugger
+    attach_json_repair(layout_refiner, repair_children_objects)
+
     # Return the agents
     return user_proxy, json_schema_debugger, layout_refiner
@@ -0,0 +1,110 @@
+class SceneGraph:
+    """
+    Indexed scene graph. Wraps the list of object dicts and keeps an id -> object
+    index, parent/child adjacency lists and a cache of resolved rotations so that
+    lookups don't need to scan the whole list
+    """
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.reindex()
+
+    def reindex(self):
+        """
+        Rebuild the index, the adjacency lists and drop all cached rotations
+        """
+        self._index = {}
+        self._order = {}
+        for i, obj in enumerate(self.objects):
+            # Keep the first object for duplicated ids, like a linear scan would
+            if obj["new_object_id"] not in self._index:
+                self._index[obj["new_object_id"]] = obj
+                self._order[obj["new_object_id"]] = i
+        self._parents = {}
+        self._children = {}
+        for obj in self.objects:
+            self._link(obj)
+        self.rotations = {}
+
+    def _link(self, obj):
+        # Only the "objects_in_room" edges connect objects with each other
+        obj_id = obj["new_object_id"]
+        parents = []
+        if "placement" in obj.keys():
+            for x in obj["placement"]["objects_in_room"]:
+                if x["object_id"] not in parents:
+                    parents.append(x["object_id"])
+        self._parents[obj_id] = parents
+        for p in parents:
+            self._children.setdefault(p, set()).add(obj_id)
+
+    def _unlink(self, obj_id):
+        for p in self._parents.pop(obj_id, []):
+            self._children.get(p, set()).discard(obj_id)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, obj_id):
+        return obj_id in self._index
+
+    def get(self, obj_id, default=None):
+        """
+        Get the object by its id
+        """
+        return self._index.get(obj_id, default)
+
+    def parents(self, obj_id):
+        """
+        Ids of the objects that obj_id is placed relative to, in placement order
+        """
+        return list(self._parents.get(obj_id, []))
+
+    def children(self, obj_id):
+        """
+        Objects that are placed relative to obj_id, in scene graph order
+        """
+        child_ids = sorted(self._children.get(obj_id, set()), key=lambda x : self._order[x])
+        return [self._index[x] for x in child_ids]
+
+    def append(self, obj):
+        self.objects.append(obj)
+        if obj["new_object_id"] not in self._index:
+            self._index[obj["new_object_id"]] = obj
+            self._order[obj["new_object_id"]] = len(self.objects) - 1
+            self._link(obj)
+        self.rotations = {}
+
+    def remove(self, obj_id):
+        """
+        Remove every object with the given id
+        """
+        self.objects = [x for x in self.objects if x["new_object_id"] != obj_id]
+        self.reindex()
+
+    def update(self, obj_id):
+        """
+        Refresh the adjacency lists after the placement or the facing of obj_id changed
+        """
+        obj = self._index.get(obj_id)
+        if obj is None:
+            return
+        self._unlink(obj_id)
+        self._link(obj)
+        # Rotations are inherited from the parents, only the ones of the object and its descendants can be stale
+        stale = set()
+        stack = [obj_id]
+        while len(stack) > 0:
+            x = stack.pop()
+            if x not in stale:
+                stale.add(x)
+                self.rotations.pop(x, None)
+                stack.extend(self._children.get(x, ()))
+
+    def to_json(self):
+        """
+        Plain list of object dicts, as stored in scene_graph.json
+        """
+        return self.objects
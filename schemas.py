@@ -1,3 +1,5 @@
+from jsonschema.validators import validator_for
+
 initial_schema = {
     "type": "object",
     "properties": {
@@ -308,3 +310,34 @@ layout_refiner_schema = {
     },
     "required": ["children_objects"]
 }
+
+
+# The validators are built once, validate() would build one and check the schema on every call
+def build_validator(schema):
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+validators = {id(schema) : build_validator(schema) for schema in (
+    initial_schema, interior_designer_schema, interior_architect_schema,
+    engineer_schema, layout_corrector_schema, deletion_schema, layout_refiner_schema
+)}
+
+def get_validator(schema):
+    """
+    The compiled validator of one of the schemas above, other schemas get a new one
+    """
+    validator = validators.get(id(schema))
+    if validator is None or validator.schema is not schema:
+        return build_validator(schema)
+    return validator
+
+def get_schema_errors(instance, schema):
+    """
+    All the validation errors of the instance, in the order of their paths
+    """
+    return sorted(get_validator(schema).iter_errors(instance), key=lambda e : [str(x) for x in e.absolute_path])
+
+def get_error_message(error):
+    path = "".join(f"[{x!r}]" for x in error.absolute_path)
+    return f"On instance{path}: {error.message}"
@@ -0,0 +1,128 @@
+import networkx as nx
+import numpy as np
+
+from utils import ROOM_LAYOUT_ELEMENTS, get_bounding_box, is_thin_object
+
+DEFAULT_WEIGHTS = {
+    "free_floor_area" : 1.0,
+    "walkway_clearance" : 1.0,
+    "wall_alignment" : 1.0,
+    "symmetry" : 1.0
+}
+
+def get_placed_objects(scene_graph):
+    """
+    Returns the placed objects of the scene graph, room layout elements excluded, and their (N, 6) boxes
+    """
+    objects = [obj for obj in scene_graph if obj["new_object_id"] not in ROOM_LAYOUT_ELEMENTS and "position" in obj.keys()]
+    boxes = np.array([get_bounding_box(obj) for obj in objects], dtype=float).reshape(-1, 6)
+    return objects, boxes
+
+def get_floor_objects(objects, boxes):
+    # Thin objects like rugs and paintings don't take up floor space
+    mask = np.array([obj["is_on_the_floor"] and not is_thin_object(obj) for obj in objects], dtype=bool)
+    return [obj for obj, m in zip(objects, mask) if m], boxes[mask]
+
+def get_xy_gaps(boxes_1, boxes_2):
+    """
+    (len(boxes_1), len(boxes_2)) distances in the xy-plane between the boxes, 0 where they touch or overlap
+    """
+    gap_before = boxes_2[None, :, 0:4:2] - boxes_1[:, None, 1:4:2]
+    gap_after = boxes_1[:, None, 0:4:2] - boxes_2[None, :, 1:4:2]
+    gap = np.maximum(np.maximum(gap_before, gap_after), 0.0)
+    return np.sqrt((gap ** 2).sum(axis=2))
+
+def get_free_floor_area(boxes, room_dimensions, resolution=0.05):
+    """
+    Fraction of the floor that isn't covered by the footprints of the boxes, on a grid of the given resolution
+    """
+    xs = np.arange(resolution / 2, room_dimensions[0], resolution)
+    ys = np.arange(resolution / 2, room_dimensions[1], resolution)
+    if len(boxes) == 0:
+        return 1.0
+    covered_x = (xs[:, None] > boxes[None, :, 0]) & (xs[:, None] < boxes[None, :, 1])
+    covered_y = (ys[:, None] > boxes[None, :, 2]) & (ys[:, None] < boxes[None, :, 3])
+    # A cell is covered if some box covers both its x and its y
+    covered = (covered_x.astype(np.uint8) @ covered_y.T.astype(np.uint8)) > 0
+    return float(1.0 - covered.mean())
+
+def get_walkway_clearance(objects, boxes, walkway=0.6, tolerance=0.05):
+    """
+    How far the clusters of objects are from each other, the clusters being the objects connected by
+    their placement relations. Every cluster scores its gap to the closest other cluster relative to
+    the walkway width, capped at 1. Clusters standing against each other, like a row of cabinets,
+    don't need a walkway between them
+    """
+    G = nx.Graph()
+    ids = [obj["new_object_id"] for obj in objects]
+    G.add_nodes_from(ids)
+    for obj in objects:
+        for x in obj["placement"]["objects_in_room"]:
+            if x["object_id"] in G.nodes():
+                G.add_edge(obj["new_object_id"], x["object_id"])
+    order = {x : i for i, x in enumerate(ids)}
+    cluster_of = {}
+    for i, component in enumerate(sorted(nx.connected_components(G), key=lambda c : min(order[x] for x in c))):
+        for x in component:
+            cluster_of[x] = i
+    labels = np.array([cluster_of[x] for x in ids], dtype=int)
+    n_clusters = len(set(labels.tolist()))
+    if n_clusters < 2:
+        return 1.0
+
+    gaps = get_xy_gaps(boxes, boxes)
+    gaps[(labels[:, None] == labels[None, :]) | (gaps <= tolerance)] = np.inf
+    cluster_gaps = np.full(n_clusters, np.inf)
+    np.minimum.at(cluster_gaps, labels, gaps.min(axis=1))
+    return float(np.minimum(cluster_gaps / walkway, 1.0).mean())
+
+def get_wall_alignment(boxes, room_dimensions, walkway=0.6, tolerance=0.05):
+    """
+    Penalizes the unusable strips between the objects and their closest wall: an object scores 1 if it's
+    against the wall or leaves at least a walkway to it, and less the closer the gap is to half a walkway
+    """
+    if len(boxes) == 0:
+        return 1.0
+    wall_gaps = np.stack([boxes[:, 0], room_dimensions[0] - boxes[:, 1], boxes[:, 2], room_dimensions[1] - boxes[:, 3]], axis=1)
+    gap = np.maximum(wall_gaps.min(axis=1), 0.0)
+    score = np.clip(1.0 - np.minimum(gap - tolerance, walkway - gap) / (walkway / 2 - tolerance), 0.0, 1.0)
+    return float(np.where((gap <= tolerance) | (gap >= walkway), 1.0, score).mean())
+
+def get_symmetry(objects, boxes):
+    """
+    How well the children of every object with at least two children are balanced around it: the
+    distance between the center of the children and the center of the parent relative to the parent's
+    half diagonal
+    """
+    index = {obj["new_object_id"] : i for i, obj in enumerate(objects)}
+    centers = (boxes[:, 0::2] + boxes[:, 1::2]) / 2
+    children = {}
+    for obj in objects:
+        for x in obj["placement"]["objects_in_room"]:
+            if x["object_id"] in index:
+                children.setdefault(x["object_id"], set()).add(index[obj["new_object_id"]])
+    scores = []
+    for parent_id, child_idx in children.items():
+        if len(child_idx) < 2:
+            continue
+        parent = index[parent_id]
+        offset = np.linalg.norm(centers[sorted(child_idx), :2].mean(axis=0) - centers[parent, :2])
+        half_diagonal = np.linalg.norm(boxes[parent, 1:4:2] - boxes[parent, 0:4:2]) / 2
+        scores.append(max(0.0, 1.0 - offset / half_diagonal) if half_diagonal > 0 else 1.0)
+    return float(np.mean(scores)) if len(scores) > 0 else 1.0
+
+def score_layout(scene_graph, room_dimensions, weights=None, walkway=0.6):
+    """
+    Quality metrics of a placed layout, each between 0 and 1, and their weighted mean as "score"
+    """
+    weights = weights if weights is not None else DEFAULT_WEIGHTS
+    objects, boxes = get_placed_objects(scene_graph)
+    floor_objects, floor_boxes = get_floor_objects(objects, boxes)
+    metrics = {
+        "free_floor_area" : get_free_floor_area(floor_boxes, room_dimensions),
+        "walkway_clearance" : get_walkway_clearance(floor_objects, floor_boxes, walkway),
+        "wall_alignment" : get_wall_alignment(floor_boxes, room_dimensions, walkway),
+        "symmetry" : get_symmetry(objects, boxes)
+    }
+    metrics["score"] = sum(weights[key] * metrics[key] for key in weights.keys()) / sum(weights.values())
+    return metrics
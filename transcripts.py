@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import json
+import threading
+
+from llm_cache import cached_oai_reply
+
+
+def get_request_key(agent_name, system_message, messages):
+    """
+    Content address of a request to an agent: the sha256 of the agent's name, system message and messages
+    """
+    content = json.dumps({
+        "agent" : agent_name,
+        "system_message" : system_message,
+        "messages" : get_compact_messages(messages)
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def get_compact_messages(messages):
+    return [{key : message.get(key) for key in ("role", "name", "content", "function_call") if message.get(key) is not None} for message in messages]
+
+
+class TranscriptRecorder:
+    """
+    Local backend that answers with the LLMs, through the response cache, or with another backend,
+    and records every request and response in a gzipped JSONL archive for TranscriptReplayer.
+    Call close once the run is done
+    """
+    def __init__(self, path, backend=None):
+        self.path = path
+        self.backend = backend
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def get_response(self, agent, messages):
+        if self.backend is not None:
+            response = self.backend.get_response(agent, messages)
+        else:
+            final, response = cached_oai_reply(agent, messages)
+            if not final:
+                final, response = agent.generate_oai_reply(messages)
+        record = {
+            "agent" : agent.name,
+            "key" : get_request_key(agent.name, agent.system_message, messages),
+            "messages" : get_compact_messages(messages),
+            "response" : response
+        }
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self.recorded += 1
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TranscriptReplayer:
+    """
+    Local backend that answers every request with the response recorded for it by
+    TranscriptRecorder. Requests are matched on their content, so the chats can run in any order.
+    A request recorded several times gets the recorded responses in order, the last one repeating
+    """
+    def __init__(self, path):
+        self.path = path
+        self.replayed = 0
+        self.responses = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                self.responses.setdefault(record["key"], []).append(record["response"])
+
+    def get_response(self, agent, messages):
+        key = get_request_key(agent.name, agent.system_message, messages)
+        if key not in self.responses:
+            raise KeyError(f"The request to {agent.name} isn't in the transcript {self.path}")
+        with self._lock:
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+            self.replayed += 1
+        return self.responses[key][min(i, len(self.responses[key]) - 1)]
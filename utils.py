@@ -1,11 +1,13 @@
+import re
 import networkx as nx
 from matplotlib import pyplot as plt
 import numpy as np
 import cv2
 from copy import copy, deepcopy
-import random
 
-from constraint_functions import get_above_constraint, get_behind_constraint, get_in_corner_constraint, get_in_front_constraint, get_left_of_constraint, get_right_of_constraint, get_on_constraint, get_under_contraint
+from constraint_functions import get_constraint_boxes
+from scene_graph import SceneGraph
+from collision import CollisionEngine, boxes_overlap
 
 ROOM_LAYOUT_ELEMENTS = ["south_wall", "north_wall", "west_wall", "east_wall", "ceiling", "middle of the room"]
 
@@ -43,38 +45,84 @@ def is_point_bbox(position):
     """
     return np.isclose(position[0], position[1]) and np.isclose(position[2], position[3]) and np.isclose(position[4], position[5])
 
-def get_rotation(obj_A, scene_graph):
-    # Get the rotation of an object in the scene graph
-    layout_rot = {
-        "west_wall" : 270.0,
-        "east_wall" : 90.0,
-        "north_wall" : 0.0,
-        "south_wall" : 180.0,
-        "middle of the room" : 0.0,
-        "ceiling" : 0.0
-    }
-
+LAYOUT_ROTATIONS = {
+    "west_wall" : 270.0,
+    "east_wall" : 90.0,
+    "north_wall" : 0.0,
+    "south_wall" : 180.0,
+    "middle of the room" : 0.0,
+    "ceiling" : 0.0
+}
+
+def get_own_rotation(obj_A):
+    # The rotation of an object that doesn't depend on its parents, None if it's inherited
     if "rotation" in obj_A.keys():
-        rot = obj_A["rotation"]["z_angle"]
-    elif "facing" in obj_A.keys() and obj_A["facing"] in layout_rot.keys():
-        rot = layout_rot[obj_A["facing"]]
-    elif obj_A["new_object_id"] in layout_rot.keys():
-        rot = layout_rot[obj_A["new_object_id"]]
-    else: 
-        parents = []
-        for x in obj_A["placement"]["objects_in_room"]:
-            try:
-                p = [element for element in scene_graph if element.get("new_object_id") == x["object_id"]][0]
-            except:
-                print(f"Object {x['object_id']} not found in scene graph!")
-                raise ValueError("Object not found in scene graph!")
-            parents.append(p)
-        if len(parents) > 0:
-            parent = parents[0]
-            rot = get_rotation(parent, scene_graph)
-        else:
-            rot = 0.0
-    return rot
+        return obj_A["rotation"]["z_angle"]
+    if "facing" in obj_A.keys() and obj_A["facing"] in LAYOUT_ROTATIONS.keys():
+        return LAYOUT_ROTATIONS[obj_A["facing"]]
+    if obj_A["new_object_id"] in LAYOUT_ROTATIONS.keys():
+        return LAYOUT_ROTATIONS[obj_A["new_object_id"]]
+    return None
+
+def resolve_rotations(scene_graph):
+    """
+    Resolves the rotations of all the objects of the SceneGraph that aren't cached yet and caches
+    them in scene_graph.rotations. The objects without a rotation of their own inherit the rotation
+    of their first parent, so the rotations are passed down from the objects that have one.
+    Returns the ids of the objects whose rotation can't be resolved, because they're in a cycle or
+    placed relative to a missing object, these get the rotation 0.0
+    """
+    rotations = scene_graph.rotations
+    pending = {}
+    children = {}
+    unresolved = []
+    for obj in scene_graph:
+        obj_id = obj["new_object_id"]
+        if obj_id in rotations or scene_graph.get(obj_id) is not obj:
+            continue
+        rot = get_own_rotation(obj)
+        parents = scene_graph.parents(obj_id)
+        if rot is None and len(parents) > 0:
+            if parents[0] not in scene_graph:
+                unresolved.append(obj_id)
+            else:
+                pending[obj_id] = parents[0]
+                children.setdefault(parents[0], []).append(obj_id)
+            continue
+        rotations[obj_id] = rot if rot is not None else 0.0
+
+    # Pass the rotations down in topological order, starting with the parents that have one
+    resolved = [parent for parent in children.keys() if parent in rotations]
+    while len(resolved) > 0:
+        parent = resolved.pop()
+        for child in children.pop(parent, []):
+            rotations[child] = rotations[parent]
+            del pending[child]
+            resolved.append(child)
+
+    # What's left is in a cycle or below an object whose rotation can't be resolved
+    unresolved.extend(pending.keys())
+    for obj_id in unresolved:
+        rotations[obj_id] = 0.0
+    return unresolved
+
+def get_rotation(obj_A, scene_graph):
+    # Get the rotation of an object in the scene graph, the rotations are resolved for the whole scene graph at once
+    rot = get_own_rotation(obj_A)
+    if rot is not None:
+        return rot
+    if not isinstance(scene_graph, SceneGraph):
+        scene_graph = SceneGraph(scene_graph)
+    obj_id = obj_A["new_object_id"]
+    if scene_graph.get(obj_id) is obj_A:
+        if obj_id not in scene_graph.rotations:
+            resolve_rotations(scene_graph)
+        return scene_graph.rotations[obj_id]
+    # An object that isn't indexed, like one with a duplicated id, inherits from its first parent
+    parents = [x["object_id"] for x in obj_A["placement"]["objects_in_room"]] if "placement" in obj_A.keys() else []
+    if len(parents) == 0 or parents[0] not in scene_graph:
+        return 0.0
+    return get_rotation(scene_graph.get(parents[0]), scene_graph)
 
 def find_key(dictionary, value):
     for key, val in dictionary.items():
@@ -82,20 +130,41 @@ def find_key(dictionary, value):
             return key
     return None
         
-def get_conflicts(G, scene_graph):
-    conflicts_wall = check_wall_relationship_impossibilities(G, scene_graph)
-    conflicts_corner = check_corner_relationship_impossibilities(G, scene_graph)
-    conflicts_room_layout = find_room_layout_conflicts(G, scene_graph)
-    conflicts_one_parent = check_corner_relationships(G, scene_graph)
-    conflicts_impossible_relationships = check_impossible_relationships(G, scene_graph)
-    return conflicts_corner + conflicts_room_layout + conflicts_one_parent + conflicts_impossible_relationships + conflicts_wall
-
-def get_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False):
-    conflicts_size = check_size_conflicts(G, scene_graph, user_input, room_priors, verbose)
+def get_conflict_objects(conflict, G):
+    """
+    The objects a conflict is about: the objects of the constraint graph named in the conflict and
+    their parents and children, room layout elements excluded since every object shares them.
+    Conflicts that offer the vacant corners all claim "vacant corners", as fixing one takes a corner
+    """
+    named = [node for node in G.nodes() if node not in ROOM_LAYOUT_ELEMENTS and re.search(r"(?<!\w)" + re.escape(node) + r"(?!\w)", conflict)]
+    objects = set(named)
+    for node in named:
+        objects.update(x for x in nx.all_neighbors(G, node) if x not in ROOM_LAYOUT_ELEMENTS)
+    if "acant corners" in conflict:
+        objects.add("vacant corners")
+    return objects
+
+def get_independent_conflicts(conflicts, G):
+    """
+    Picks, in order, the conflicts that are about disjoint sets of objects, so that they can be fixed
+    at the same time. The first conflict is always picked
+    """
+    independent = []
+    claimed = set()
+    for conflict in conflicts:
+        objects = get_conflict_objects(conflict, G)
+        if len(independent) == 0 or claimed.isdisjoint(objects):
+            independent.append(conflict)
+            claimed.update(objects)
+    return independent
+
+def get_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False, cluster_sizes=None):
+    conflicts_size = check_size_conflicts(G, scene_graph, user_input, room_priors, verbose, cluster_sizes)
     return conflicts_size
 
 def preprocess_scene_graph(scene_graph):
     # Correct the preposition for objects in the middle of the room
+    object_ids = [x["new_object_id"] for x in scene_graph]
     for obj in scene_graph:
         if not obj["is_on_the_floor"] and "middle of the room" in [x["layout_element_id"] for x in obj["placement"]["room_layout_elements"]]:
             #Delete that relationship
@@ -108,13 +177,15 @@ def preprocess_scene_graph(scene_graph):
                 # Delete that relationship
                 obj["placement"]["objects_in_room"] = [x for x in obj["placement"]["objects_in_room"] if x["object_id"] != "middle of the room"]
                 continue
-            if elem["object_id"] not in [x["new_object_id"] for x in scene_graph]:
-                closest_id = next(iter([x["new_object_id"] for x in scene_graph if elem["object_id"] in x["new_object_id"]]), None)
+            if elem["object_id"] not in object_ids:
+                closest_id = next(iter([x for x in object_ids if elem["object_id"] in x]), None)
                 if closest_id is not None:
                     elem["object_id"] = closest_id
                 else:
                     print(f"Object {elem['object_id']} not found in scene graph!")
                     raise ValueError("Object not found in scene graph!")
+    if isinstance(scene_graph, SceneGraph):
+        scene_graph.reindex()
     return scene_graph
 
 def build_graph(scene_graph):
@@ -134,51 +205,10 @@ def build_graph(scene_graph):
             G.add_edge(constraint["object_id"], obj["new_object_id"], weight={"preposition" : constraint["preposition"], "adjacency" : constraint["is_adjacent"]})
     return G
 
-def find_room_layout_conflicts(G, scene_graph):
-    conflicts = []
-
-    topological_order = list(nx.topological_sort(G))
-    node_layout = dict(G.nodes(data=True))
-    for node in topological_order:
-        if node not in ROOM_LAYOUT_ELEMENTS:
-            parents = list(G.predecessors(node))
-            parents_room_layout = [node_layout[p] for p in parents]
-            different_parent_room_layout = False
-            for p in parents_room_layout[1:]:
-                if isinstance(p, list):
-                    if isinstance(parents_room_layout[0], list):
-                        different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
-                    else:
-                        different_parent_room_layout = True if parents_room_layout[0] not in p else different_parent_room_layout
-                elif isinstance(p, str):
-                    if isinstance(parents_room_layout[0], list):
-                        different_parent_room_layout = True if p not in parents_room_layout[0] else different_parent_room_layout
-                    else:
-                        different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
-                elif isinstance(p, dict):
-                    if isinstance(parents_room_layout[0], list):
-                        different_parent_room_layout = True if p not in parents_room_layout[0] else different_parent_room_layout
-                    else:
-                        different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
-            if len(parents_room_layout) > 0 and different_parent_room_layout:
-                # This should be a spatial conflict, if the relationship isn't 'corner'
-                if not all([G[p][node]["weight"]["preposition"] == "in the corner" for p in parents]) and not any([p == "ceiling" for p in parents]):
-                    conflict_string = f"The object {node} cannot have the parents {parents} at the same time! Eliminate one."
-                    conflict_string += "\nObject to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
-                    conflicts.append(conflict_string)
-                else:
-                    # node_layout[node] = parents_room_layout
-                    node_layout[node] = {}
-            else:
-                node_layout[node] = parents_room_layout[0]
-
-        if node in ROOM_LAYOUT_ELEMENTS:
-            node_layout[node] = node
-    return conflicts
-
-def remove_unnecessary_edges(G):
+def remove_unnecessary_edges(G, scene_graph=None):
     """
-    Remove non-corner relationships if the object has a corner relationship
+    Remove non-corner relationships if the object has a corner relationship.
+    If the scene graph is given, the relationships are removed from it as well
     """
     topological_order = list(nx.topological_sort(G))
     for node in topological_order:
@@ -191,6 +221,10 @@ def remove_unnecessary_edges(G):
                         if G[p][node]["weight"]["preposition"] != "in the corner":
                             print(f"Removing edge {p} -> {node} with preposition {G[p][node]['weight']['preposition']}")
                             G.remove_edge(p, node)
+                            obj = get_object_from_scene_graph(node, scene_graph) if scene_graph is not None else None
+                            if obj is not None:
+                                obj["placement"]["room_layout_elements"] = [x for x in obj["placement"]["room_layout_elements"] if x["layout_element_id"] != p]
+                                obj["placement"]["objects_in_room"] = [x for x in obj["placement"]["objects_in_room"] if x["object_id"] != p]
     return G
 
 def handle_under_prepositions(G, scene_graph):
@@ -211,177 +245,205 @@ def handle_under_prepositions(G, scene_graph):
                     nodes_to_remove.append(e[1])
     for node in nodes_to_remove:
         print("Removing node: ", node)
-        scene_graph = [x for x in scene_graph if x["new_object_id"] != node]
+        if isinstance(scene_graph, SceneGraph):
+            scene_graph.remove(node)
+        else:
+            scene_graph = [x for x in scene_graph if x["new_object_id"] != node]
         if node in G.nodes():
             G.remove_node(node)
     return G, scene_graph
 
-def check_corner_relationships(G, scene_graph):
-    def find_corner_vacancy():
-        # Find the corner that is not occupied
-        corners = [("south_wall", "west_wall"), ("south_wall", "east_wall"), ("north_wall", "west_wall"), ("north_wall", "east_wall")]
-        occupied_corners = []
-        for wall_1, wall_2 in corners:
-            for node in topological_order:
-                if node not in ROOM_LAYOUT_ELEMENTS:
-                    parents = list(G.predecessors(node))
-                    if wall_1 in parents and wall_2 in parents:
-                        occupied_corners.append((wall_1, wall_2))
-        vacant_corners = list(set(corners) - set(occupied_corners))
-        return vacant_corners
-    
-    def find_corner_occupancy():
-        # Find whether corners are occupied by more than one object 
-        corners = [("south_wall", "west_wall"), ("south_wall", "east_wall"), ("north_wall", "west_wall"), ("north_wall", "east_wall")]
-        occupied_corners = {k : [] for k in corners}
-        for wall_1, wall_2 in corners:
-            for node in topological_order:
-                if node not in ROOM_LAYOUT_ELEMENTS:
-                    parents = list(G.predecessors(node))
-                    if wall_1 in parents and wall_2 in parents:
-                        occupied_corners[(wall_1, wall_2)].append(node)
-        return occupied_corners
+directional_preps = ["in front", "left of", "behind", "right of"]
 
-    topological_order = list(nx.topological_sort(G))
-    conflicts = []
+CORNERS = [("south_wall", "west_wall"), ("south_wall", "east_wall"), ("north_wall", "west_wall"), ("north_wall", "east_wall")]
 
-    corner_occupancy = find_corner_occupancy()
-    for key, value in corner_occupancy.items():
-        if len(value) > 1:
-            conflict_string = f"The corner {key[0].split('_')[0]}-{key[1].split('_')[0]} is occupied by more than one object: {value}. Move one of them to another vacant corner."
-            conflict_string += "\nVacant corners: " + str(find_corner_vacancy())
-            conflicts.append(conflict_string)
-        
+# The direction out of the room beyond each wall, for an object facing north
+WALL_IMPOSSIBLE_PREPS = {
+    "south_wall" : "behind",
+    "north_wall" : "in front",
+    "west_wall" : "left of",
+    "east_wall" : "right of"
+}
 
-    # Check whether objects with "corner" relationships have two corresponding walls
-    for node in topological_order:
-        if node not in ROOM_LAYOUT_ELEMENTS:
-            parents = list(G.predecessors(node))
-            if any([G[p][node]["weight"]["preposition"] == "in the corner" for p in parents]):
-                if len(parents) == 1:
-                    vacant_corners = find_corner_vacancy()
-                    vacant_corners = [f"{c[0].split('_')[0]}-{c[1].split('_')[0]} corner" for c in vacant_corners]
-                    conflict_string = f"Corner relationship for {node} has {len(parents)} parent, add another wall to the relationship. \n Current vacant corners: {vacant_corners}"
-                    conflict_string += "\nObject to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
-                    conflicts.append(conflict_string)
-    return conflicts
+def get_rotated_prep(prep, rot):
+    idx = directional_preps.index(prep)
+    return directional_preps[int((idx + (rot // 90)) % len(directional_preps))]
 
-directional_preps = ["in front", "left of", "behind", "right of"]
+def get_parent_layout(node, G, node_layout):
+    """
+    The room layout the node inherits from its parents, and whether the parents are in different
+    room layouts without the node being in a corner or on the ceiling
+    """
+    parents = list(G.predecessors(node))
+    parents_room_layout = [node_layout.get(p, {}) for p in parents]
+    different_parent_room_layout = False
+    for p in parents_room_layout[1:]:
+        if isinstance(p, list):
+            if isinstance(parents_room_layout[0], list):
+                different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
+            else:
+                different_parent_room_layout = True if parents_room_layout[0] not in p else different_parent_room_layout
+        elif isinstance(p, str):
+            if isinstance(parents_room_layout[0], list):
+                different_parent_room_layout = True if p not in parents_room_layout[0] else different_parent_room_layout
+            else:
+                different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
+        elif isinstance(p, dict):
+            if isinstance(parents_room_layout[0], list):
+                different_parent_room_layout = True if p not in parents_room_layout[0] else different_parent_room_layout
+            else:
+                different_parent_room_layout = True if p != parents_room_layout[0] else different_parent_room_layout
+    if len(parents_room_layout) == 0:
+        return {}, False
+    if different_parent_room_layout:
+        # This should be a spatial conflict, if the relationship isn't 'corner'
+        in_corner = all([G[p][node]["weight"]["preposition"] == "in the corner" for p in parents]) or any([p == "ceiling" for p in parents])
+        return {}, not in_corner
+    return parents_room_layout[0], False
+
+def get_sorted_out_edges(G, node):
+    """
+    The outgoing edges of node by child id, the conflict texts don't depend on the order the edges
+    were added in
+    """
+    return sorted(G.out_edges(node, data=True), key=lambda edge : edge[1])
 
-def check_corner_relationship_impossibilities(G, scene_graph):
-    conflicts = []
-    # Check for impossible relationships in corners
-    wall_impossible_preps = {
-        "south_wall" : "behind",
-        "north_wall" : "in front",
-        "west_wall" : "left of",
-        "east_wall" : "right of"
-    }
+def get_node_conflicts(node, G, scene_graph, node_layout):
+    """
+    The conflicts of one object of the constraint graph, by kind. node_layout has to hold the room
+    layout of the node's parents and gets the node's, the rotations are cached in the SceneGraph.
+    The corners the node occupies and whether it's in a corner with a single wall are returned
+    under "corners" and "one_wall_corner", the conflicts about corners need the whole room
+    """
+    def get_rot(obj_id):
+        return get_rotation(get_object_from_scene_graph(obj_id, scene_graph), scene_graph)
+
+    conflicts = {"corner" : [], "room_layout" : [], "impossible_relationships" : [], "wall" : []}
+    parents_raw = list(G.predecessors(node))
+    parents = list(filter(lambda x : x not in ROOM_LAYOUT_ELEMENTS, parents_raw))
+    preps = {p : G[p][node]["weight"]["preposition"] for p in parents_raw}
+
+    for p in parents:
+        r = get_rot(p)
+        p_parent = list(G.predecessors(p))
+
+        # Check whether the parent object is in the corner and if this object is located spatially correctly
+        corners = [p_p for p_p in p_parent if G[p_p][p]["weight"]["preposition"] == "in the corner"]
+        if len(corners) == 2:
+            corner_name = corners[0].split('_')[0] + "-" + corners[1].split('_')[0] + " corner"
+            impossible_preps = [get_rotated_prep(WALL_IMPOSSIBLE_PREPS[p_p], r) for p_p in corners]
+            if preps[p] in impossible_preps:
+                conflict_string = [
+                    f"The object {node} cannot be {preps[p]} the object {p} as it would be placed out of bounds. ",
+                    f"The {impossible_preps[0]} and {impossible_preps[1]} the object are out of bounds. Find another relationship for {node} either with {p}, on the {corners[0]} or on the {corners[1]}!",
+                    f"This relationship has to be exclusive, you cannot have two objects with the same relative positioning. IMPORTANT: you can only have one relationship in the new scene graph!!!",
+                ]
+                conflict_string = "\n".join(conflict_string)
+                conflict_string += f"The object {p} is on the {corner_name}. "
+                conflict_string += " ".join([f"{p} has the object {edge[1]} {edge[2]['weight']['preposition']} it. " for edge in get_sorted_out_edges(G, p) if edge[1] != node and edge[2]["weight"]["adjacency"]])
+                conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
+                conflicts["corner"].append(conflict_string)
+
+        # Check whether the parent object is on a wall and if this object is located spatially correctly
+        walls = [p_p for p_p in p_parent if p_p in WALL_IMPOSSIBLE_PREPS.keys() and G[p_p][p]["weight"]["preposition"] == "on"]
+        for p_p in walls:
+            impossible_prep = get_rotated_prep(WALL_IMPOSSIBLE_PREPS[p_p], r)
+            if preps[p] == impossible_prep:
+                conflict_string =[
+                    f"The object {node} cannot be {preps[p]} the object {p} as it would be placed out of bounds. ",
+                    f"The {impossible_prep} the object is out of bounds. Find another relationship for {node} either with {p}, on the {p_p}!",
+                    f"This relationship has to be exclusive, you cannot have two objects with the same relative positioning. IMPORTANT: you can only have one relationship in the new scene graph!!!",
+                ]
+                conflict_string = "\n".join(conflict_string)
+                conflict_string += f"The object {p} is on the {p_p}. "
+                conflict_string += " ".join([f"{p} has the object {edge[1]} {edge[2]['weight']['preposition']} it. " for edge in get_sorted_out_edges(G, p) if edge[1] != node and edge[2]["weight"]["adjacency"]])
+                conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
+                conflicts["wall"].append(conflict_string)
+
+    # Parents in different parts of the room
+    node_layout[node], is_conflict = get_parent_layout(node, G, node_layout)
+    if is_conflict:
+        conflict_string = f"The object {node} cannot have the parents {parents_raw} at the same time! Eliminate one."
+        conflict_string += "\nObject to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
+        conflicts["room_layout"].append(conflict_string)
+
+    # Adjacent child exclusivity
+    for p in parents:
+        adj = G[p][node]["weight"]["adjacency"]
+        if preps[p] in directional_preps and adj:
+            impossible_prep = directional_preps[(directional_preps.index(get_rotated_prep(preps[p], get_rot(node))) + 2) % len(directional_preps)]
+            for c in G.successors(node):
+                if G[node][c]["weight"]["preposition"] == impossible_prep and G[node][c]["weight"]["adjacency"]:
+                    conflict_string = f"The object {c} cannot be {G[node][c]['weight']['preposition']} of the object {node} since the {p} object is there. Find another relationship for {c} with {node}!"
+                    conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(c, scene_graph))
+                    conflicts["impossible_relationships"].append(conflict_string)
+
+    conflicts["corners"] = [corner for corner in CORNERS if corner[0] in parents_raw and corner[1] in parents_raw]
+    conflicts["one_wall_corner"] = len(parents_raw) == 1 and preps[parents_raw[0]] == "in the corner"
+    return conflicts
 
-    topological_order = list(nx.topological_sort(G))
+def get_corner_conflicts(node_conflicts, topological_order, scene_graph):
+    """
+    The conflicts of the corners occupied by more than one object and of the objects in a corner with
+    a single wall, from the conflicts get_node_conflicts found for the nodes
+    """
+    occupied_corners = {k : [] for k in CORNERS}
     for node in topological_order:
-        if node not in ROOM_LAYOUT_ELEMENTS:
-            parents_raw = list(G.predecessors(node))
-            parents = list(filter(lambda x : x not in ROOM_LAYOUT_ELEMENTS, parents_raw))
-            parents_rot = [get_rotation(next((x for x in scene_graph if x["new_object_id"] == p), None), scene_graph) for p in parents]
-            # Check whether the parent object is in the corner and if this object is located spatially correctly
-            for p, r in zip(parents, parents_rot):
-                p_parent = list(G.predecessors(p))
-                corners = [p_p for p_p in p_parent if G[p_p][p]["weight"]["preposition"] == "in the corner"]
-                impossible_preps = []
-                if len(corners) != 2:
-                    continue
-                for p_p in corners:
-                    corner_name = corners[0].split('_')[0] + "-" + corners[1].split('_')[0] + " corner"
-                    impossible_prep = wall_impossible_preps[p_p]
-                    idx = directional_preps.index(impossible_prep)
-                    rotated_idx = int((idx + (r // 90)) % len(directional_preps))
-                    impossible_prep = directional_preps[rotated_idx]
-                    impossible_preps.append(impossible_prep)
-                    # print(f"Impossible prep for {p} with rotation {r}: {impossible_prep}")
-                if G[p][node]["weight"]["preposition"] in impossible_preps:
-                    # print(f"Impossible relationship between {node} and {p} with rotation {r} and relationship {G[p][node]['weight']}")
-                    # print(f"Parent '{p}' in edges: {G.out_edges(p, data=True)}")
-                    conflict_string = [
-                        f"The object {node} cannot be {G[p][node]['weight']['preposition']} the object {p} as it would be placed out of bounds. ",
-                        f"The {impossible_preps[0]} and {impossible_preps[1]} the object are out of bounds. Find another relationship for {node} either with {p}, on the {corners[0]} or on the {corners[1]}!",
-                        f"This relationship has to be exclusive, you cannot have two objects with the same relative positioning. IMPORTANT: you can only have one relationship in the new scene graph!!!",
-                    ]
-                    conflict_string = "\n".join(conflict_string)
-                    conflict_string += f"The object {p} is on the {corner_name}. "
-                    conflict_string += " ".join([f"{p} has the object {edge[1]} {edge[2]['weight']['preposition']} it. " for edge in G.out_edges(p, data=True) if edge[1] != node and edge[2]["weight"]["adjacency"]])
-                    conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
-                    conflicts.append(conflict_string)
-    return conflicts
+        if node in node_conflicts:
+            for corner in node_conflicts[node]["corners"]:
+                occupied_corners[corner].append(node)
+    vacant_corners = [k for k in CORNERS if len(occupied_corners[k]) == 0]
 
-def check_wall_relationship_impossibilities(G, scene_graph):
     conflicts = []
-    # Check for impossible relationships in corners
-    wall_impossible_preps = {
-        "south_wall" : "behind",
-        "north_wall" : "in front",
-        "west_wall" : "left of",
-        "east_wall" : "right of"
-    }
+    for key, value in occupied_corners.items():
+        if len(value) > 1:
+            conflict_string = f"The corner {key[0].split('_')[0]}-{key[1].split('_')[0]} is occupied by more than one object: {value}. Move one of them to another vacant corner."
+            conflict_string += "\nVacant corners: " + str(vacant_corners)
+            conflicts.append(conflict_string)
 
-    topological_order = list(nx.topological_sort(G))
+    # Check whether objects with "corner" relationships have two corresponding walls
     for node in topological_order:
-        if node not in ROOM_LAYOUT_ELEMENTS:
-            parents_raw = list(G.predecessors(node))
-            parents = list(filter(lambda x : x not in ROOM_LAYOUT_ELEMENTS, parents_raw))
-            parents_rot = [get_rotation(next((x for x in scene_graph if x["new_object_id"] == p), None), scene_graph) for p in parents]
-            # Check whether the parent object is in the corner and if this object is located spatially correctly
-            for p, r in zip(parents, parents_rot): 
-                p_parent_raw = list(G.predecessors(p))
-                p_parent = list(filter(lambda x : x in wall_impossible_preps.keys(), p_parent_raw))
-                walls = [p_p for p_p in p_parent if G[p_p][p]["weight"]["preposition"] == "on"]
-                for p_p in walls:
-                    impossible_prep = wall_impossible_preps[p_p]
-                    idx = directional_preps.index(impossible_prep)
-                    rotated_idx = int((idx + (r // 90)) % len(directional_preps))
-                    impossible_prep = directional_preps[rotated_idx]
-                    if G[p][node]["weight"]["preposition"] == impossible_prep:
-                        conflict_string =[
-                            f"The object {node} cannot be {G[p][node]['weight']['preposition']} the object {p} as it would be placed out of bounds. ",
-                            f"The {impossible_prep} the object is out of bounds. Find another relationship for {node} either with {p}, on the {p_p}!",
-                            f"This relationship has to be exclusive, you cannot have two objects with the same relative positioning. IMPORTANT: you can only have one relationship in the new scene graph!!!",
-                        ]
-                        conflict_string = "\n".join(conflict_string)
-                        conflict_string += f"The object {p} is on the {p_p}. "
-                        conflict_string += " ".join([f"{p} has the object {edge[1]} {edge[2]['weight']['preposition']} it. " for edge in G.out_edges(p, data=True) if edge[1] != node and edge[2]["weight"]["adjacency"]])
-                        conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
-                        conflicts.append(conflict_string)
+        if node in node_conflicts and node_conflicts[node]["one_wall_corner"]:
+            vacant_corner_names = [f"{c[0].split('_')[0]}-{c[1].split('_')[0]} corner" for c in vacant_corners]
+            conflict_string = f"Corner relationship for {node} has 1 parent, add another wall to the relationship. \n Current vacant corners: {vacant_corner_names}"
+            conflict_string += "\nObject to reposition: " + str(get_object_from_scene_graph(node, scene_graph))
+            conflicts.append(conflict_string)
     return conflicts
 
-
-def check_impossible_relationships(G, scene_graph):
-    conflicts = []
+def get_conflicts(G, scene_graph):
+    """
+    The spatial conflicts of the constraint graph, found in a single walk over the graph in
+    topological order that computes the parents and rotations of the objects once
+    """
+    if not isinstance(scene_graph, SceneGraph):
+        scene_graph = SceneGraph(scene_graph)
     topological_order = list(nx.topological_sort(G))
-    # Check for impossible relationships between objects
+    node_layout = {}
+    node_conflicts = {}
     for node in topological_order:
-        if node not in ROOM_LAYOUT_ELEMENTS:
-            parents_raw = list(G.predecessors(node))
-            parents = list(filter(lambda x : x not in ROOM_LAYOUT_ELEMENTS, parents_raw))
-            children = list(G.successors(node))
-            node_rot = get_rotation(next((x for x in scene_graph if x["new_object_id"] == node), None), scene_graph) 
-            # Adjacent child exclusivity
-            for p in parents:
-                prep = G[p][node]["weight"]["preposition"]
-                adj = G[p][node]["weight"]["adjacency"]
-                if prep in directional_preps and adj:
-                    idx = directional_preps.index(prep)
-                    rotated_idx = int((idx + (node_rot // 90)) % len(directional_preps))
-                    impossible_prep = directional_preps[(rotated_idx + 2) % len(directional_preps)] 
-                    for c in children:
-                        if G[node][c]["weight"]["preposition"] == impossible_prep and G[node][c]["weight"]["adjacency"]:
-                            # print(f"Impossible relationship between {node} and {c} with rotation {node_rot} and relationship {G[node][c]['weight']['preposition']}")
-                            conflict_string = f"The object {c} cannot be {G[node][c]['weight']['preposition']} of the object {node} since the {p} object is there. Find another relationship for {c} with {node}!"
-                            conflict_string += "\n Object to reposition: " + str(get_object_from_scene_graph(c, scene_graph))
-                            conflicts.append(conflict_string)
-    return conflicts
+        if node in ROOM_LAYOUT_ELEMENTS:
+            node_layout[node] = node
+        else:
+            node_conflicts[node] = get_node_conflicts(node, G, scene_graph, node_layout)
+    return join_conflicts(node_conflicts, topological_order, scene_graph)
 
-def get_cluster_size(node, G, scene_graph): 
-    # Get the size of the cluster of objects
+def join_conflicts(node_conflicts, topological_order, scene_graph):
+    conflicts = {key : [] for key in ("corner", "room_layout", "impossible_relationships", "wall")}
+    for node in topological_order:
+        if node in node_conflicts:
+            for key in conflicts.keys():
+                conflicts[key].extend(node_conflicts[node][key])
+    corner_conflicts = get_corner_conflicts(node_conflicts, topological_order, scene_graph)
+    return conflicts["corner"] + conflicts["room_layout"] + corner_conflicts + conflicts["impossible_relationships"] + conflicts["wall"]
+
+def get_cluster_size(node, G, scene_graph, cluster_sizes=None, rank=None):
+    # Get the size of the cluster of objects, from the cached cluster sizes of the children
+    if cluster_sizes is not None and node in cluster_sizes:
+        return cluster_sizes[node]
+    if rank is None:
+        rank = get_topological_rank(G)
+    if not isinstance(scene_graph, SceneGraph):
+        scene_graph = SceneGraph(scene_graph)
     node_obj = get_object_from_scene_graph(node, scene_graph)
     try:
         node_obj_rot = get_rotation(node_obj, scene_graph)
@@ -390,11 +452,8 @@ def get_cluster_size(node, G, scene_graph):
         raise ValueError("Error in getting the rotation of the object!")
     # Get the outgoing edges
     outgoing_e = list(G.out_edges(node, data=True))
-    outgoing_nodes = [edge[1] for edge in outgoing_e]
-    # Get the topological order of the outgoing nodes
-    topological_order_reversed = list(reversed(list(nx.topological_sort(G))))
-    topological_outgoing_nodes = [node for node in topological_order_reversed if node in outgoing_nodes]
-    outgoing_e_sorted = sorted(outgoing_e, key=lambda x : topological_outgoing_nodes.index(x[1]))
+    # Visit the outgoing nodes in reverse topological order
+    outgoing_e_sorted = sorted(outgoing_e, key=lambda x : -rank[x[1]])
     size_constraint = {"left of" : 0.0, "right of" : 0.0, "behind" : 0.0, "in front" : 0.0}
     children_objs = set()
     if len(outgoing_e_sorted) != 0:
@@ -420,7 +479,7 @@ def get_cluster_size(node, G, scene_graph):
             size_constraint_value = edge_obj["size_in_meters"][size_constraint_key]
 
             # Retrieve the size of the cluster and the additional descendants of the child object
-            edge_cluster_size, edge_children = get_cluster_size(edge[1], G, scene_graph)
+            edge_cluster_size, edge_children = get_cluster_size(edge[1], G, scene_graph, cluster_sizes, rank)
             children_objs = children_objs.union(edge_children)
 
             # Adjust the size constraint based on the preposition 
@@ -431,17 +490,54 @@ def get_cluster_size(node, G, scene_graph):
                     size_constraint[prep] = max(size_constraint[prep], value_to_add)
                 else:
                     size_constraint[prep] += value_to_add         
+    if cluster_sizes is not None:
+        cluster_sizes[node] = (size_constraint, children_objs)
     return size_constraint, children_objs
 
-def check_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False):
+def get_topological_rank(G):
+    return {node : i for i, node in enumerate(nx.topological_sort(G))}
+
+def get_cluster_sizes(G, scene_graph, cluster_sizes=None):
+    """
+    Cluster sizes of all the objects of G, as {node : (size_constraint, children_objs)} like
+    get_cluster_size. The sizes are computed bottom-up in reverse topological order, every cluster
+    from the sizes of its children, and added to cluster_sizes, where the sizes that are already
+    cached are reused
+    """
+    if cluster_sizes is None:
+        cluster_sizes = {}
+    if not isinstance(scene_graph, SceneGraph):
+        scene_graph = SceneGraph(scene_graph)
+    rank = get_topological_rank(G)
+    for node in sorted(rank, key=lambda x : -rank[x]):
+        if node not in ROOM_LAYOUT_ELEMENTS and node not in cluster_sizes:
+            get_cluster_size(node, G, scene_graph, cluster_sizes, rank)
+    return cluster_sizes
+
+def invalidate_cluster_sizes(cluster_sizes, G, nodes):
+    """
+    Drop the cached cluster sizes that can change when the edges, the size or the facing of nodes
+    change: the nodes, their descendants, which inherit their rotation, and all of their ancestors.
+    Call it before removing nodes from G and after adding edges to it
+    """
+    changed = set()
+    for node in nodes:
+        if node in G.nodes():
+            changed.add(node)
+            changed.update(nx.descendants(G, node))
+    for node in list(changed):
+        changed.update(nx.ancestors(G, node))
+    for node in changed:
+        cluster_sizes.pop(node, None)
+
+def check_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False, cluster_sizes=None):
     conflicts = []
-    topological_order_reversed = list(reversed(list(nx.topological_sort(G))))
+    if not isinstance(scene_graph, SceneGraph):
+        scene_graph = SceneGraph(scene_graph)
+    rank = get_topological_rank(G)
+    topological_order_reversed = sorted(rank, key=lambda x : -rank[x])
+    cluster_sizes = get_cluster_sizes(G, scene_graph, cluster_sizes)
 
-    if verbose:
-        for node in topological_order_reversed:
-            if node not in ROOM_LAYOUT_ELEMENTS:
-                clstr_size, children_objs = get_cluster_size(node, G, scene_graph)
-                
     # Find cluster size conflicts
     for node in topological_order_reversed:
         if node not in ROOM_LAYOUT_ELEMENTS:
@@ -496,9 +592,7 @@ def check_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False)
             node_obj = get_object_from_scene_graph(node, room_priors)
             node_obj_rot = get_rotation(node_obj, scene_graph)
             outgoing_e = list(G.out_edges(node, data=True))
-            outgoing_nodes = [edge[1] for edge in outgoing_e]
-            topological_outgoing_nodes = [node for node in topological_order_reversed if node in outgoing_nodes]
-            outgoing_e_sorted = sorted(outgoing_e, key=lambda x : topological_outgoing_nodes.index(x[1]))
+            outgoing_e_sorted = sorted(outgoing_e, key=lambda x : -rank[x[1]])
 
             outgoing_set = set()
             size_constraint = 0.0 if node != "middle of the room" else (0.0, 0.0)
@@ -509,7 +603,7 @@ def check_size_conflicts(G, scene_graph, user_input, room_priors, verbose=False)
                 if not edge_obj["is_on_the_floor"]:
                     continue
                 edge_obj_rot = get_rotation(edge_obj, scene_graph)
-                cluster_size, e_children = get_cluster_size(edge[1], G, scene_graph)
+                cluster_size, e_children = cluster_sizes[edge[1]]
                 print(f"Cluster size for {edge[1]}: {cluster_size}")
                 rot_diff = abs(node_obj_rot - edge_obj_rot)
                 constraint_key = ("length", "width") if rot_diff % 180 == 0 else ("width", "length")
@@ -578,6 +672,8 @@ def get_object_from_scene_graph(obj_id, scene_graph):
     """
     Get the object from the scene graph by its id
     """
+    if isinstance(scene_graph, SceneGraph):
+        return scene_graph.get(obj_id)
     return next((x for x in scene_graph if x["new_object_id"] == obj_id), None)
 
 def has_one_parent_and_one_child(tree):
@@ -808,58 +904,57 @@ def calculate_overlap(box1, box2):
     else:
         return None
 
+def get_bounding_box(obj, position=None):
+    """
+    Returns the axis-aligned bounding box (x_min, x_max, y_min, y_max, z_min, z_max) of the object
+    """
+    pos = obj["position"] if position is None else position
+    size = obj["size_in_meters"]
+    length, width = size["length"], size["width"]
+    # Swap dimensions if needed
+    if np.isclose(obj["rotation"]["z_angle"], 90.0) or np.isclose(obj["rotation"]["z_angle"], 270.0):
+        length, width = width, length
+    return (
+        pos["x"] - length / 2, pos["x"] + length / 2,
+        pos["y"] - width / 2, pos["y"] + width / 2,
+        pos["z"] - size["height"] / 2, pos["z"] + size["height"] / 2
+    )
+
 def is_collision_3d(obj1, obj2, bbox_instead = False):
-    pos1, rot1, size1 = copy(obj1['position']), copy(obj1["rotation"]["z_angle"]), copy(obj1['size_in_meters'])
     # We won't check for collisions for objects with very thin surfaces
     if is_thin_object(obj1):
         return False
     if not bbox_instead:
-        pos2, rot2, size2 = copy(obj2['position']), copy(obj2["rotation"]["z_angle"]), copy(obj2['size_in_meters'])
         # We won't check for collisions for objects with very thin surfaces
-        try:
-            if is_thin_object(obj2):
-                return False
-        except:
-            print(obj2)
-            raise Exception
+        if is_thin_object(obj2):
+            return False
+        box2 = get_bounding_box(obj2)
     else:
-        pos2, rot2, size2 = {"x" : (obj2[1] + obj2[0]) / 2 , "y" : (obj2[3] + obj2[2]) / 2, "z" : (obj2[5] + obj2[4]) / 2}, 0.0, {"length" : (obj2[1] - obj2[0]), "width" : (obj2[3] - obj2[2]), "height" : (obj2[5] - obj2[4])}
-
-
-    def swap_dimensions_if_rotated(size, rotation):
-        if np.isclose(rotation, 90.0) or np.isclose(rotation, 270.0):
-            size["length"], size["width"] = size["width"], size["length"]
-
-    def get_bounds(pos, size):
-        x_max = pos['x'] + size['length'] / 2
-        x_min = pos['x'] - size['length'] / 2
-        y_max = pos['y'] + size['width'] / 2
-        y_min = pos['y'] - size['width'] / 2
-        z_max = pos['z'] + size['height'] / 2
-        z_min = pos['z'] - size['height'] / 2
-        return x_max, x_min, y_max, y_min, z_max, z_min
-
-    def check_overlap(min1, max1, min2, max2):
-        return min1 < max2 and max1 > min2 and abs(min1 - max2) > 1e-3 and abs(max1 - min2) > 1e-3
+        box2 = obj2
+    return bool(boxes_overlap(get_bounding_box(obj1), box2)[0, 0])
 
-    # Swap dimensions if needed
-    swap_dimensions_if_rotated(size1, rot1)
-    swap_dimensions_if_rotated(size2, rot2)
-
-    # Get bounds for both objects
-    obj1_bounds = get_bounds(pos1, size1)
-    obj2_bounds = get_bounds(pos2, size2)
-
-    # Unpack bounds
-    (obj1_x_max, obj1_x_min, obj1_y_max, obj1_y_min, obj1_z_max, obj1_z_min) = obj1_bounds
-    (obj2_x_max, obj2_x_min, obj2_y_max, obj2_y_min, obj2_z_max, obj2_z_min) = obj2_bounds
+def update_collision_engine(collision_engine, obj):
+    """
+    Store the current bounding box of the object in the collision engine, or drop it if it isn't placed
+    """
+    if "position" in obj.keys() and not is_thin_object(obj):
+        collision_engine.set(obj["new_object_id"], get_bounding_box(obj))
+    else:
+        collision_engine.remove(obj["new_object_id"])
 
-    # Check for overlap in each dimension
-    x_check = check_overlap(obj1_x_min, obj1_x_max, obj2_x_min, obj2_x_max)
-    y_check = check_overlap(obj1_y_min, obj1_y_max, obj2_y_min, obj2_y_max)
-    z_check = check_overlap(obj1_z_min, obj1_z_max, obj2_z_min, obj2_z_max)
+def build_collision_engine(scene_graph, room_dimensions=None):
+    collision_engine = CollisionEngine(room_dimensions=room_dimensions)
+    for obj in scene_graph:
+        update_collision_engine(collision_engine, obj)
+    return collision_engine
 
-    return x_check and y_check and z_check
+def count_collisions(obj, collision_engine):
+    """
+    Number of placed objects colliding with the object
+    """
+    if "position" not in obj.keys() or is_thin_object(obj):
+        return 0
+    return collision_engine.count(get_bounding_box(obj), exclude=[obj["new_object_id"]])
 
 def get_depth(scene_graph):
     G = nx.DiGraph()
@@ -901,37 +996,226 @@ def get_depth(scene_graph):
     all_nodes_depth = {k: v for k, v in all_nodes_depth.items() if k not in prior_ids}
     return all_nodes_depth
 
+def get_constraint_row(obj_A, obj_B, constraint):
+    adjacency = constraint["is_adjacent"] if "is_adjacent" in constraint.keys() else True
+    return (obj_A, obj_B, constraint["preposition"], adjacency, obj_A["is_on_the_floor"])
+
 def get_possible_positions(object_id, scene_graph, room_dimensions):
-    obj = [element for element in scene_graph if element.get("new_object_id") == object_id][0]
+    obj = get_object_from_scene_graph(object_id, scene_graph)
     obj_scene_graph = obj["placement"]
     rot = get_rotation(obj, scene_graph)
     obj["rotation"] = {"z_angle" : rot}
 
-    func_map = {
-        "on" : get_on_constraint,
-        "under" : get_under_contraint,
-        "left of" : get_left_of_constraint,
-        "right of" : get_right_of_constraint,
-        "in front" : get_in_front_constraint,
-        "behind" : get_behind_constraint,
-        "above" : get_above_constraint,
-        "in the corner" : get_in_corner_constraint,
-        "in the middle of" : get_on_constraint
-    }
-
+    # The boxes of all the constraints of the object are computed at once
     constraints = obj_scene_graph["room_layout_elements"] + obj_scene_graph["objects_in_room"]
-    possible_positions = []
+    rows = []
     for constraint in constraints:
-        prep = constraint["preposition"]
-        adjacency = constraint["is_adjacent"] if "is_adjacent" in constraint.keys() else True
-        is_on_floor = obj["is_on_the_floor"]
-        obj_A = obj
         key = "layout_element_id" if "layout_element_id" in constraint.keys() else "object_id"
-        obj_B = [element for element in scene_graph if element.get("new_object_id") == constraint[key]][0]
+        obj_B = get_object_from_scene_graph(constraint[key], scene_graph)
         if "position" in obj_B.keys():
-            possible_positions.append(func_map[prep](obj_A, obj_B, adjacency, is_on_floor, room_dimensions))
+            rows.append(get_constraint_row(obj, obj_B, constraint))
+
+    return [tuple(box) for box in get_constraint_boxes(rows, room_dimensions).tolist()]
+
+def get_cluster_constraint(obj, room_dimensions):
+    """
+    Box of the positions that leave enough space around the object for its cluster
+    """
+    abs_length, abs_width = obj["size_in_meters"]["length"], obj["size_in_meters"]["width"]
+    x_neg, x_pos, y_neg, y_pos = obj["cluster"]["constraint_area"]["x_neg"], obj["cluster"]["constraint_area"]["x_pos"], obj["cluster"]["constraint_area"]["y_neg"], obj["cluster"]["constraint_area"]["y_pos"]
+    raw_constraint = (
+        x_neg + abs_length / 2,
+        y_pos + abs_width / 2,
+        x_pos + abs_length / 2,
+        y_neg + abs_width / 2,  
+    )
+    shift = int(obj["rotation"]["z_angle"] // 90)
+    raw_constraint = raw_constraint[-shift:] + raw_constraint[:-shift]
+        
+    return (
+        raw_constraint[0],
+        room_dimensions[0] - raw_constraint[2],
+        raw_constraint[3],
+        room_dimensions[1] - raw_constraint[1],
+        0.0,
+        room_dimensions[2] 
+    )
 
-    return possible_positions
+def propagate_to_children(arcs, room_dimensions):
+    """
+    Box of the positions of obj_A that satisfy the constraint for some position of obj_B in domain_B,
+    for every (obj_A, obj_B, constraint, domain_B) arc, computed at once.
+    Every bound of a constraint box grows monotonically with the position of obj_B along the same
+    axis, so the box is spanned by the constraints at the lowest and the highest corner of domain_B
+    """
+    rows, positions = [], []
+    for obj_A, obj_B, constraint, domain_B in arcs:
+        domain_B = np.asarray(domain_B, dtype=float)
+        rows += [get_constraint_row(obj_A, obj_B, constraint)] * 2
+        positions += [np.minimum(domain_B[0::2], domain_B[1::2]), np.maximum(domain_B[0::2], domain_B[1::2])]
+    boxes = get_constraint_boxes(rows, room_dimensions, np.reshape(positions, (-1, 3))).reshape(-1, 2, 6)
+    spans = np.where(np.arange(6) % 2 == 0, boxes.min(axis=1), boxes.max(axis=1))
+    return [tuple(span) for span in spans.tolist()]
+
+def propagate_to_parents(arcs, room_dimensions, n_steps=24, tolerance=1e-03):
+    """
+    Shrinks domain_B to the positions of obj_B for which the constraint still leaves obj_A some
+    position in domain_A, for every (obj_A, obj_B, constraint, domain_A, domain_B) arc. The new
+    domain is None if there isn't any.
+    The bounds are found by bisection along the three axes at once, keeping the outer end so
+    that no feasible position is lost. The bisections of all the arcs, for the lower and the upper
+    bounds, go together
+    """
+    rows = [get_constraint_row(obj_A, obj_B, constraint) for obj_A, obj_B, constraint, _, _ in arcs]
+    domains_A = np.array([arc[3] for arc in arcs], dtype=float).reshape(-1, 6)
+    domains_B = np.array([arc[4] for arc in arcs], dtype=float).reshape(-1, 6)
+    lows, highs = np.minimum(domains_B[:, 0::2], domains_B[:, 1::2]), np.maximum(domains_B[:, 0::2], domains_B[:, 1::2])
+    target_low, target_high = np.minimum(domains_A[:, 0::2], domains_A[:, 1::2]) - tolerance, np.maximum(domains_A[:, 0::2], domains_A[:, 1::2]) + tolerance
+
+    def get_boxes(positions_1, positions_2):
+        boxes = get_constraint_boxes(rows + rows, room_dimensions, np.concatenate([positions_1, positions_2]))
+        return boxes[:len(rows)], boxes[len(rows):]
+    # The upper bound of the constraint box has to reach domain_A...
+    def reaches(boxes):
+        return boxes[:, 1::2] >= target_low
+    # ...and its lower bound must not go past it
+    def stays(boxes):
+        return boxes[:, 0::2] <= target_high
+
+    boxes_low, boxes_high = get_boxes(lows, highs)
+    feasible = reaches(boxes_high).all(axis=1) & stays(boxes_low).all(axis=1)
+    left_1, right_1 = lows.copy(), highs.copy()
+    done_1 = reaches(boxes_low)
+    left_2, right_2 = lows.copy(), highs.copy()
+    done_2 = stays(boxes_high)
+    for _ in range(n_steps):
+        if done_1.all() and done_2.all():
+            break
+        middle_1, middle_2 = (left_1 + right_1) / 2, (left_2 + right_2) / 2
+        boxes_1, boxes_2 = get_boxes(middle_1, middle_2)
+        ok_1, ok_2 = reaches(boxes_1), stays(boxes_2)
+        right_1 = np.where(ok_1 & ~done_1, middle_1, right_1)
+        left_1 = np.where(~ok_1 & ~done_1, middle_1, left_1)
+        left_2 = np.where(ok_2 & ~done_2, middle_2, left_2)
+        right_2 = np.where(~ok_2 & ~done_2, middle_2, right_2)
+    new_lows = np.where(done_1, lows, left_1).tolist()
+    new_highs = np.where(done_2, highs, right_2).tolist()
+
+    domains = []
+    for i, arc in enumerate(arcs):
+        if not feasible[i]:
+            domains.append(None)
+            continue
+        domains.append(calculate_overlap(arc[4], (new_lows[i][0], new_highs[i][0], new_lows[i][1], new_highs[i][1], new_lows[i][2], new_highs[i][2])))
+    return domains
+
+def propagate_constraints(scene_graph, room_dimensions, topological_order=None, max_rounds=10, verbose=False):
+    """
+    Arc consistency over the constraint graph before any object is placed. Every object starts
+    with the box of its possible positions in the room, which is then tightened by the boxes of its
+    parents and by the boxes of its children until nothing changes.
+    Returns the object id -> box dict, objects whose box became empty are infeasible and map to None.
+    The room layout elements are fixed and map to their position
+    """
+    objects = [obj for obj in scene_graph if "placement" in obj.keys()]
+    for obj in objects:
+        obj["rotation"] = {"z_angle" : get_rotation(obj, scene_graph)}
+    object_ids = [obj["new_object_id"] for obj in objects]
+    if topological_order is not None:
+        object_ids = [x for x in topological_order if x in object_ids]
+
+    fixed = {}
+    for obj in scene_graph:
+        if "placement" not in obj.keys() and "position" in obj.keys():
+            pos = obj["position"]
+            fixed[obj["new_object_id"]] = (pos["x"], pos["x"], pos["y"], pos["y"], pos["z"], pos["z"])
+
+    # (parent, constraint) and (child, constraint) lists of every object
+    parents = {x : [] for x in object_ids}
+    children = {x : [] for x in object_ids}
+    for obj_id in object_ids:
+        obj = get_object_from_scene_graph(obj_id, scene_graph)
+        for constraint in obj["placement"]["room_layout_elements"] + obj["placement"]["objects_in_room"]:
+            key = "layout_element_id" if "layout_element_id" in constraint.keys() else "object_id"
+            if constraint[key] in fixed.keys() or constraint[key] in parents.keys():
+                parents[obj_id].append((constraint[key], constraint))
+                if constraint[key] in children.keys():
+                    children[constraint[key]].append((obj_id, constraint))
+
+    # The objects of a level have no constraints between them, so the boxes of a whole level are
+    # propagated at once, in the order of the sweeps over object_ids
+    G = nx.DiGraph()
+    G.add_nodes_from(object_ids)
+    G.add_edges_from((parent_id, obj_id) for obj_id in object_ids for parent_id, _ in parents[obj_id] if parent_id in children.keys())
+    order = {x : i for i, x in enumerate(object_ids)}
+    levels = [sorted(level, key=lambda x : order[x]) for level in nx.topological_generations(G)]
+
+    def is_changed(old, new):
+        return new is None or not np.allclose(old, new, atol=1e-06)
+
+    infeasible = set()
+    while True:
+        domains = dict(fixed)
+        for obj_id in object_ids:
+            obj = get_object_from_scene_graph(obj_id, scene_graph)
+            size = obj["size_in_meters"]
+            length, width = size["length"], size["width"]
+            if obj["rotation"]["z_angle"] in [90.0, 270.0]:
+                length, width = width, length
+            domain = (length / 2, room_dimensions[0] - length / 2, width / 2, room_dimensions[1] - width / 2, size["height"] / 2, room_dimensions[2] - size["height"] / 2)
+            if "cluster" in obj.keys():
+                domain = calculate_overlap(domain, get_cluster_constraint(obj, room_dimensions))
+            domains[obj_id] = domain if obj_id not in infeasible else None
+
+        for i in range(max_rounds):
+            changed = False
+            # Parents to children
+            for level in levels:
+                arcs, arc_ids = [], []
+                for obj_id in level:
+                    obj = get_object_from_scene_graph(obj_id, scene_graph)
+                    for parent_id, constraint in parents[obj_id]:
+                        if domains[obj_id] is not None and domains[parent_id] is not None:
+                            arcs.append((obj, get_object_from_scene_graph(parent_id, scene_graph), constraint, domains[parent_id]))
+                            arc_ids.append(obj_id)
+                for obj_id, box in zip(arc_ids, propagate_to_children(arcs, room_dimensions)):
+                    if domains[obj_id] is None:
+                        continue
+                    domain = calculate_overlap(domains[obj_id], box)
+                    changed = changed or is_changed(domains[obj_id], domain)
+                    domains[obj_id] = domain
+            # Children to parents, the children of an object shrink its box one after the other
+            for level in reversed(levels):
+                queues = {obj_id : list(children[obj_id]) for obj_id in level}
+                while True:
+                    arcs, arc_ids = [], []
+                    for obj_id in reversed(level):
+                        queue = queues[obj_id]
+                        while len(queue) > 0 and domains[queue[0][0]] is None:
+                            queue.pop(0)
+                        if domains[obj_id] is None or len(queue) == 0:
+                            continue
+                        child_id, constraint = queue.pop(0)
+                        arcs.append((get_object_from_scene_graph(child_id, scene_graph), get_object_from_scene_graph(obj_id, scene_graph), constraint, domains[child_id], domains[obj_id]))
+                        arc_ids.append(obj_id)
+                    if len(arcs) == 0:
+                        break
+                    for obj_id, domain in zip(arc_ids, propagate_to_parents(arcs, room_dimensions)):
+                        changed = changed or is_changed(domains[obj_id], domain)
+                        domains[obj_id] = domain
+            if not changed:
+                break
+        if verbose:
+            print(f"Constraint propagation converged after {i + 1} rounds")
+
+        new_infeasible = set(x for x in object_ids if domains[x] is None) - infeasible
+        if len(new_infeasible) == 0:
+            break
+        # Start over without the infeasible objects, like the placement does when it leaves them out
+        if verbose:
+            print("Infeasible objects: ", new_infeasible)
+        infeasible.update(new_infeasible)
+    return domains
 
 def get_topological_ordering(scene_graph):
     G = nx.DiGraph()
@@ -985,33 +1269,168 @@ def get_no_overlap_reason(obj, positions, cluster_constraint=None, errors={}):
             errors[key] = 1 + errors.get(key, 0)
     return errors
 
-def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False):
+def get_conflicting_objects(errors, scene_graph, room_dimensions, collision_engine):
+    """
+    Returns the ids of the placed objects that the placement errors can be blamed on:
+    the parents whose constraints don't overlap, or the parents and the objects occupying
+    the space of an object that couldn't be placed
+    """
+    conflicting = set()
+    for key in errors.keys():
+        if key[0] == "no_overlap":
+            conflicting.update([key[2]] + ([key[4]] if len(key) > 5 else []))
+        elif key[0] == "no_positions_found":
+            obj = get_object_from_scene_graph(key[1], scene_graph)
+            if obj is None:
+                continue
+            conflicting.update([x["object_id"] for x in obj["placement"]["objects_in_room"]])
+            positions = get_possible_positions(key[1], scene_graph, room_dimensions)
+            overlap = positions[0] if len(positions) > 0 else None
+            for pos in positions[1:]:
+                overlap = calculate_overlap(overlap, pos)
+            if overlap is None:
+                continue
+            # Space that the object could have occupied
+            size = obj["size_in_meters"]
+            length, width = size["length"], size["width"]
+            if np.isclose(obj["rotation"]["z_angle"], 90.0) or np.isclose(obj["rotation"]["z_angle"], 270.0):
+                length, width = width, length
+            region = (
+                min(overlap[0], overlap[1]) - length / 2, max(overlap[0], overlap[1]) + length / 2,
+                min(overlap[2], overlap[3]) - width / 2, max(overlap[2], overlap[3]) + width / 2,
+                min(overlap[4], overlap[5]) - size["height"] / 2, max(overlap[4], overlap[5]) + size["height"] / 2
+            )
+            conflicting.update(collision_engine.get_overlapping_ids(region, exclude=[key[1]]))
+    return [x for x in conflicting if x not in ROOM_LAYOUT_ELEMENTS and "position" in (get_object_from_scene_graph(x, scene_graph) or {})]
+
+HALTON_BASES = [2, 3, 5, 7, 11, 13]
+
+def get_halton_points(n_samples, dims, start=0):
+    """
+    Points start + 1, ..., start + n_samples of the Halton sequence in [0, 1)^dims
+    """
+    points = np.zeros((n_samples, dims))
+    for dim, base in enumerate(HALTON_BASES[:dims]):
+        indices = np.arange(start + 1, start + n_samples + 1)
+        fraction = 1.0
+        while np.any(indices > 0):
+            fraction /= base
+            points[:, dim] += fraction * (indices % base)
+            indices = indices // base
+    return points
+
+def get_unit_samples(n_samples, dims, rng=None, sampling="uniform"):
+    """
+    n_samples points in [0, 1)^dims drawn with rng. sampling is "uniform", or "halton" / "sobol" for
+    low-discrepancy sequences that cover the space more evenly. The sequences are randomly shifted
+    so that every call gives different points
+    """
+    rng = rng if rng is not None else np.random
+    if sampling == "uniform":
+        return rng.uniform(size=(n_samples, dims))
+    if sampling == "halton":
+        points = get_halton_points(n_samples, dims, start=int(rng.uniform(0, 2 ** 16)))
+        return (points + rng.uniform(size=dims)) % 1.0
+    if sampling == "sobol":
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError("Sobol sampling requires scipy, install it or use the halton sampling")
+        return qmc.Sobol(d=dims, scramble=True, seed=int(rng.uniform(0, 2 ** 31))).random(n_samples)
+    raise ValueError(f"Unknown sampling: {sampling}")
+
+def sample_positions(obj, overlap, collision_engine, n_samples=256, free_space=True, rng=None, sampling="uniform"):
+    """
+    Draws a batch of candidate positions for the object inside the overlap box, drops the ones that
+    collide with the placed objects and ranks the rest by their clearance to the other objects.
+    With free_space, the candidates are only drawn from the cells of the overlap box that aren't
+    covered by the placed objects. The candidates are drawn with rng, see get_unit_samples for sampling
+    """
+    size = obj["size_in_meters"]
+    length, width = size["length"], size["width"]
+    if np.isclose(obj["rotation"]["z_angle"], 90.0) or np.isclose(obj["rotation"]["z_angle"], 270.0):
+        length, width = width, length
+    half_size = np.array([length / 2, width / 2, size["height"] / 2])
+    exclude = [obj["new_object_id"]]
+    thin = is_thin_object(obj)
+
+    if is_point_bbox(overlap):
+        samples = np.array([[overlap[0], overlap[2], overlap[4]]])
+    else:
+        cells = collision_engine.get_free_cells(overlap, half_size, exclude) if free_space and not thin else None
+        if cells is None:
+            cells = np.array([overlap], dtype=float)
+        if len(cells) == 0:
+            return []
+        # Pick the cells proportionally to their volume, degenerate axes don't count
+        extents = cells[:, 1::2] - cells[:, 0::2]
+        volumes = np.prod(np.where(extents > 0, extents, 1.0), axis=1)
+        unit_samples = get_unit_samples(n_samples, 4, rng, sampling)
+        cumulative = np.cumsum(volumes / volumes.sum())
+        cell_idx = np.minimum(np.searchsorted(cumulative, unit_samples[:, 0], side="right"), len(cells) - 1)
+        samples = cells[cell_idx, 0::2] + unit_samples[:, 1:] * extents[cell_idx]
+
+    boxes = np.empty((len(samples), 6))
+    boxes[:, 0::2] = samples - half_size
+    boxes[:, 1::2] = samples + half_size
+    if not thin:
+        collision_free = ~collision_engine.collides(boxes, exclude)
+        samples, boxes = samples[collision_free], boxes[collision_free]
+
+    # Objects against a wall are packed next to each other so that the wall space doesn't get
+    # fragmented, the others prefer the candidates that leave the most space around them
+    if not thin:
+        parent_ids = [x["object_id"] for x in obj["placement"]["objects_in_room"]]
+        clearance = collision_engine.get_clearance(boxes, exclude + parent_ids + ROOM_LAYOUT_ELEMENTS)
+        on_wall = any(x["layout_element_id"].endswith("_wall") and x["preposition"] == "on" for x in obj["placement"]["room_layout_elements"])
+        samples = samples[np.argsort(clearance if on_wall else -clearance, kind="stable")]
+        samples = spread_samples(samples, half_size)
+    return [{"x" : float(x), "y" : float(y), "z" : float(z)} for x, y, z in samples]
+
+def spread_samples(samples, half_size):
+    """
+    Reorders ranked samples so that the best sample of every object-sized cell of the floor comes
+    first, then the second best of every cell and so on. The retries of place_object then try
+    different spots instead of near duplicates of the best one
+    """
+    if len(samples) == 0:
+        return samples
+    cells = np.floor(samples[:, :2] / (2 * half_size[:2])).astype(int)
+    _, cell_idx = np.unique(cells, axis=0, return_inverse=True)
+    cell_idx = cell_idx.reshape(-1)
+    # Rank of every sample within its cell, the samples are already sorted
+    order = np.argsort(cell_idx, kind="stable")
+    starts = np.searchsorted(cell_idx[order], cell_idx[order], side="left")
+    rank_in_cell = np.empty(len(samples), dtype=int)
+    rank_in_cell[order] = np.arange(len(samples)) - starts
+    return samples[np.argsort(rank_in_cell, kind="stable")]
+
+def use_attempt(budget):
+    """
+    Counts one candidate position against the {"attempts" : n, "stop" : event} budget shared by the
+    whole search, False once it's used up or the event is set. The event can live in another
+    process, it's only checked every 16 attempts
+    """
+    if budget is None:
+        return True
+    if budget.get("stop") is not None and budget["attempts"] % 16 == 0 and budget["stop"].is_set():
+        budget["attempts"] = 0
+    if budget["attempts"] <= 0:
+        return False
+    budget["attempts"] -= 1
+    return True
+
+def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False, topological_order=None, collision_engine=None, n_samples=256, free_space=True, domains=None, rng=None, sampling="uniform", budget=None):
     if verbose:
         get_visualization(scene_graph)
-    if not any(d.get("new_object_id") == obj["new_object_id"] for d in scene_graph):
+    if get_object_from_scene_graph(obj["new_object_id"], scene_graph) is None:
         return errors
+    if collision_engine is None:
+        collision_engine = build_collision_engine(scene_graph, room_dimensions)
     positions = get_possible_positions(obj["new_object_id"], scene_graph, room_dimensions)
     print(f"Object: {obj['new_object_id']}")
     print("Possible positions: ", positions)
-    abs_length, abs_width = deepcopy(obj["size_in_meters"]["length"]), deepcopy(obj["size_in_meters"]["width"])
-    x_neg, x_pos, y_neg, y_pos = obj["cluster"]["constraint_area"]["x_neg"], obj["cluster"]["constraint_area"]["x_pos"], obj["cluster"]["constraint_area"]["y_neg"], obj["cluster"]["constraint_area"]["y_pos"]
-    raw_constraint = (
-        x_neg + abs_length / 2,
-        y_pos + abs_width / 2,
-        x_pos + abs_length / 2,
-        y_neg + abs_width / 2,  
-    )
-    shift = int(obj["rotation"]["z_angle"] // 90)
-    raw_constraint = raw_constraint[-shift:] + raw_constraint[:-shift]
-        
-    cluster_constraint = (
-        raw_constraint[0],
-        room_dimensions[0] - raw_constraint[2],
-        raw_constraint[3],
-        room_dimensions[1] - raw_constraint[1],
-        0.0,
-        room_dimensions[2] 
-    )
+    cluster_constraint = get_cluster_constraint(obj, room_dimensions)
     if verbose:
         print("Cluster constraint: ", cluster_constraint)
     if len(positions) == 0:
@@ -1019,22 +1438,20 @@ def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False):
         key = ("no_positions_found", obj["new_object_id"])
         errors[key] = 1 + errors.get(key, 0)
         return errors 
-    children = [element for element in scene_graph if "placement" in element.keys() and obj.get("new_object_id") in [x["object_id"] for x in element["placement"]["objects_in_room"]]]
-    topological_sorted = get_topological_ordering(scene_graph)
+    if isinstance(scene_graph, SceneGraph):
+        children = scene_graph.children(obj["new_object_id"])
+    else:
+        children = [element for element in scene_graph if "placement" in element.keys() and obj.get("new_object_id") in [x["object_id"] for x in element["placement"]["objects_in_room"]]]
+    topological_sorted = topological_order if topological_order is not None else get_topological_ordering(scene_graph)
 
     # Check condition to skip placing object
     if "position" in obj.keys():
-        current_collisions = 0
-        for obj_B in scene_graph:
-            if obj_B == obj or "position" not in obj_B.keys():
-                continue
-            if is_collision_3d(obj, obj_B):
-                current_collisions += 1
+        current_collisions = count_collisions(obj, collision_engine)
         overlap = calculate_overlap(cluster_constraint, positions[0])
         for pos in positions[1:]:
             overlap = calculate_overlap(overlap, pos)
         check_preposition = is_collision_3d(obj, overlap, bbox_instead=True) if overlap is not None else False
-        check_children = any([is_collision_3d(child, item) for child in children if "position" in child.keys() for item in scene_graph if item["new_object_id"] != child["new_object_id"] and "position" in item.keys()])
+        check_children = any([count_collisions(child, collision_engine) > 0 for child in children])
         if current_collisions == 0 and check_preposition and (not check_children or len(children) == 0):
             if verbose:
                 print("Object already placed: ", obj["new_object_id"])
@@ -1054,53 +1471,41 @@ def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False):
             print("No overlap found for object: ", obj["new_object_id"])
         errors = get_no_overlap_reason(obj, positions, cluster_constraint, errors)
         return errors
-    
-    counter = 0
-    while True:
-        counter += 1
-        if counter > 50:
+    # Keep the object inside the box where its children can still be placed
+    if domains is not None and domains.get(obj["new_object_id"]) is not None:
+        overlap = calculate_overlap(overlap, domains[obj["new_object_id"]])
+        if overlap is None:
             if verbose:
-                print("No positions found for object: ", obj["new_object_id"])
-                print(overlap)
-            del obj["position"]
-            # If there wasn't any errors, it means that the object was colliding with other objects
-            if not errors:
-                key = ("no_positions_found", obj["new_object_id"])
-                errors[key] = 1 + errors.get(key, 0)
-                # Updated: Just delete the object
-                # print("OBJECT DELETED!!")
-                # scene_graph.remove(obj)
+                print("No overlap with the propagated box for object: ", obj["new_object_id"])
+            key = ("no_positions_found", obj["new_object_id"])
+            errors[key] = 1 + errors.get(key, 0)
             return errors
-        if is_point_bbox(overlap):
-            counter = 50
-        x = random.uniform(overlap[0], overlap[1])
-        y = random.uniform(overlap[2], overlap[3])
-        z = random.uniform(overlap[4], overlap[5])
-        obj["position"] = {
-            "x" : x,
-            "y" : y,
-            "z" : z
-        }
+    
+    candidates = sample_positions(obj, overlap, collision_engine, n_samples=n_samples, free_space=free_space, rng=rng, sampling=sampling)
+    if verbose:
+        print(f"{len(candidates)} collision free candidates for object: ", obj["new_object_id"])
+    # Topologically sort children
+    children = [x for topo in topological_sorted for x in children if topo == x["new_object_id"]]
+    if domains is not None:
+        # The infeasible children are left out
+        children = [x for x in children if domains.get(x["new_object_id"], ()) is not None]
+    for position in candidates[:50]:
+        if not use_attempt(budget):
+            if verbose:
+                print("Out of attempts for object: ", obj["new_object_id"])
+            key = ("out_of_attempts", obj["new_object_id"])
+            errors[key] = 1 + errors.get(key, 0)
+            break
+        obj["position"] = position
+        update_collision_engine(collision_engine, obj)
         if verbose:
             print("Assigned position: ", obj["position"], " to object: ", obj["new_object_id"])
-        flag = False
-        for obj_B in scene_graph:
-            if obj_B == obj or "position" not in obj_B.keys():
-                continue
-            if is_collision_3d(obj, obj_B):
-                flag = True
-                break
-        if flag:
-            continue
         
         child_flag = False
-        # Topologically sort children
-        children = [x for topo in topological_sorted for x in children if topo == x["new_object_id"]]
-        # print("Sorted children: ", [x["new_object_id"] for x in children])
         for child in children:
             if verbose:
                 print(obj["new_object_id"], " placing child: ", child["new_object_id"])
-            errors_child = place_object(child, scene_graph, room_dimensions, errors={})
+            errors_child = place_object(child, scene_graph, room_dimensions, errors={}, topological_order=topological_sorted, collision_engine=collision_engine, n_samples=n_samples, free_space=free_space, domains=domains, rng=rng, sampling=sampling, budget=budget)
             if verbose:
                 print("Errors child: ", errors_child)
             if errors_child:
@@ -1119,11 +1524,22 @@ def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False):
             for child in children:
                 if "position" in child.keys():
                     del child["position"]
+                    collision_engine.remove(child["new_object_id"])
             continue
         if verbose:
             print("Object placed: ", obj["new_object_id"])
-        errors = {}
-        break 
+        return {}
+
+    if verbose:
+        print("No positions found for object: ", obj["new_object_id"])
+        print(overlap)
+    if "position" in obj.keys():
+        del obj["position"]
+        collision_engine.remove(obj["new_object_id"])
+    # If there wasn't any errors, it means that the object was colliding with other objects
+    if not errors:
+        key = ("no_positions_found", obj["new_object_id"])
+        errors[key] = 1 + errors.get(key, 0)
     return errors
 
 
@@ -1131,3 +1547,4 @@ def place_object(obj, scene_graph, room_dimensions, errors={}, verbose=False):
 
 
 
+